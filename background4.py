@@ -1,43 +1,116 @@
 import os
 import re
+import queue
+import time
 import shutil
+import threading
 import tkinter as tk
 from tkinter import ttk, colorchooser, IntVar, simpledialog, messagebox, filedialog
-from PIL import Image, ImageTk, ImageOps
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
 from logger import Logger
+from observador import ObservadorPasta
 from functions import (
     gerar_codigo,
-    carregar_presets,
-    salvar_presets,
+    ArmazemPresets,
     carregar_imagens,
     carregar_g1_colorido,
-    gerar_imagem_final
+    ContextoRender,
+    renderizar_lote,
+    renderizar_todos,
+    colorir_g1,
+    escurecer,
+    camada_preta_solida,
+    miniatura_fundo,
+    gerar_miniatura_galeria,
+    carregar_reduzida,
+    carregar_indice,
+    PERFIS_SAIDA,
+    PERFIL_SAIDA_PADRAO,
+    perfil_saida,
+    vincular_da_loja,
+    salvar_imagem_no_preset,
+    limpar_loja,
+    remover_miniaturas,
+    iniciar_cronometro,
+    parar_cronometro
 )
 
 # --- CONFIGURAÇÕES GLOBAIS E CONSTANTES ---
 BASE_DIR = os.getcwd()
 DATA_FILE = os.path.join(BASE_DIR, "presets.json")
+PRESETS_SQLITE = False # Guarda os presets em presets.db (SQLite, uma linha por preset); na primeira vez importa o presets.json
 DEFAULT_PRESET = "standard"
 DEFAULT_PRESET_DATA = {DEFAULT_PRESET: {"code": "standard", "color": "#FFFFFF", "mostrar_fundo": False}}
+RENDER_WORKERS = None # Número de threads usadas em gerar() (None = uma por CPU)
+CRONOMETRAR_GERACAO = False # Registra no log o tempo de cada etapa (decodificação, colorização, ...) de cada geração
+SALVAR_TRACE_GERACAO = False # Com a cronometragem ligada, salva também um trace do Chrome na pasta de logs
 
 # --- INICIALIZAÇÃO DO LOGGER ---
-logger = Logger()
+# As mensagens são gravadas por uma thread em segundo plano; log() não espera pelo disco
+logger = Logger(background=True, compress=True)
 
 # Função para salvar os logs periodicamente
 def periodic_save():
-    logger.write_buffer_to_file()
+    logger.flush() # No modo background, a gravação fica com a thread do logger
     # Agenda a próxima execução para daqui a 5 minutos (300000 ms)
     janela.after(300000, periodic_save)
 
 # Função para ser chamada ao fechar a janela
 def on_closing():
     logger.log("--- Sessão encerrada pelo usuário. Salvando logs finais. ---")
-    logger.write_buffer_to_file()
+    logger.close()
+    armazem_presets.fechar()
+    galeria.encerrar()
+    if observador is not None:
+        observador.parar()
     janela.destroy()
 
 # Variáveis de estado da aplicação
 cor_selecionada = "#FFFFFF"
 imagens_atuais = []
+observador = None # ObservadorPasta da pasta do preset atual
+eventos_pasta = queue.Queue() # Mudanças de arquivos vindas do observador, aplicadas na thread do Tk
+INTERVALO_EVENTOS_PASTA = 100 # ms entre as verificações da fila de eventos do observador
+
+# --- AGENDAMENTO DE ATUALIZAÇÕES ---
+
+class AgendadorTk:
+    """
+    Agrupa rajadas de eventos (traces, <Configure>, ...) em uma única chamada
+    de 'funcao', feita quando o Tk fica ocioso (atraso=0) ou 'atraso' ms
+    depois do último evento. Pedidos que chegam antes da execução apenas
+    substituem o anterior, então só o estado mais recente é processado.
+    """
+    def __init__(self, widget, funcao, atraso=0):
+        self.widget = widget
+        self.funcao = funcao
+        self.atraso = atraso
+        self._after_id = None
+
+    def agendar(self, *args):
+        if self._after_id is not None:
+            if not self.atraso:
+                return # Já existe uma execução pendente para quando o Tk ficar ocioso
+            self.widget.after_cancel(self._after_id)
+        if self.atraso:
+            self._after_id = self.widget.after(self.atraso, self._executar)
+        else:
+            self._after_id = self.widget.after_idle(self._executar)
+
+    def cancelar(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _executar(self):
+        self._after_id = None
+        try:
+            if not self.widget.winfo_exists():
+                return # A janela foi fechada antes da execução
+        except tk.TclError:
+            return
+        self.funcao()
 
 # --- FUNÇÕES DA INTERFACE GRÁFICA (GUI) ---
 
@@ -85,10 +158,15 @@ def abrir_janela_edicao_g1():
     editor_g1_window.grab_set()
 
     # --- Variáveis de Estado e CACHE ---
+    # O preview trabalha sobre uma cópia reduzida (proxy) no tamanho do canvas;
+    # a resolução real só é usada ao salvar, em aplicar_e_fechar.
     canvas_image_id = None
     novo_caminho_selecionado = None
-    cached_g1_original = None
-    cached_black_img = None
+    cached_g1_fonte = None
+    cached_black_fonte = None
+    cached_g1_proxy = None
+    cached_g1_proxy_l = None
+    cached_black_proxy = None
 
     # --- CRIAÇÃO DOS WIDGETS (com layout corrigido) ---
     top_frame = tk.Frame(editor_g1_window)
@@ -115,7 +193,7 @@ def abrir_janela_edicao_g1():
     # --- Checkbox "no color" (MOVIDO PARA A DIREITA) ---
     no_color_var = tk.BooleanVar(value=PRESETS[preset_atual].get("no_color", False))
     # O checkbox é empacotado primeiro para a direita
-    no_color_check = tk.Checkbutton(top_frame, variable=no_color_var, command=lambda: regenerate_caches())
+    no_color_check = tk.Checkbutton(top_frame, variable=no_color_var, command=lambda: agendador_preview.agendar())
     no_color_check.pack(side="right")
     # O texto é empacotado depois, ficando à esquerda do checkbox
     no_color_label = tk.Label(top_frame, text="no color")
@@ -138,54 +216,85 @@ def abrir_janela_edicao_g1():
     btn_procurar.pack()
 
     # --- FUNÇÕES INTERNAS (sem alterações) ---
-    def regenerate_caches():
-        nonlocal cached_g1_original, cached_black_img
+    def tamanho_no_canvas(largura, altura):
+        """Maior tamanho com a proporção da imagem que cabe no canvas (ou None se o canvas ainda não tem tamanho)."""
+        canvas_w = canvas_preview.winfo_width()
+        canvas_h = canvas_preview.winfo_height()
+        if canvas_w <= 1 or canvas_h <= 1: return None
+        aspect_ratio = largura / altura
+        if canvas_w / canvas_h > aspect_ratio:
+            new_h = canvas_h
+            new_w = int(new_h * aspect_ratio)
+        else:
+            new_w = canvas_w
+            new_h = int(new_w / aspect_ratio)
+        return max(new_w, 1), max(new_h, 1)
+
+    def carregar_fontes():
+        """Decodifica g1 e black em resolução real; só é refeito quando a imagem de origem muda."""
+        nonlocal cached_g1_fonte, cached_black_fonte, cached_g1_proxy
         caminho_base = novo_caminho_selecionado if novo_caminho_selecionado else caminho_g1_original
         try:
-            cached_g1_original = Image.open(caminho_base).convert("RGBA")
-            if os.path.exists(caminho_black_png):
-                cached_black_img = Image.open(caminho_black_png).convert("RGBA")
-                if cached_black_img.size != cached_g1_original.size:
-                    cached_black_img = cached_black_img.resize(cached_g1_original.size, Image.Resampling.LANCZOS)
+            cached_g1_fonte = Image.open(caminho_base).convert("RGBA")
+            # Preto sólido (ou sem black.png) não precisa ser carregado: a opacidade é analítica
+            if camada_preta_solida(caminho_black_png):
+                cached_black_fonte = None
+            else:
+                cached_black_fonte = Image.open(caminho_black_png).convert("RGBA")
+            cached_g1_proxy = None # Força a recriação do proxy
+        except Exception as e:
+            print(f"Erro ao carregar imagens de origem: {e}")
+
+    def regenerate_caches():
+        nonlocal cached_g1_proxy, cached_g1_proxy_l, cached_black_proxy
+        if cached_g1_fonte is None:
+            carregar_fontes()
+            if cached_g1_fonte is None: return
+        try:
+            tamanho_proxy = tamanho_no_canvas(*cached_g1_fonte.size)
+            if not tamanho_proxy: return
+            if cached_g1_proxy and cached_g1_proxy.size == tamanho_proxy:
+                update_g1_preview()
+                return
+            # Reduz uma única vez para o tamanho do canvas; cor e opacidade são aplicadas só no proxy
+            cached_g1_proxy = cached_g1_fonte.resize(tamanho_proxy, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            cached_g1_proxy_l = cached_g1_proxy.convert("L")
+            if cached_black_fonte:
+                cached_black_proxy = cached_black_fonte.resize(tamanho_proxy, Image.Resampling.LANCZOS, reducing_gap=2.0)
             else:
-                cached_black_img = Image.new("RGBA", cached_g1_original.size, (0, 0, 0, 255))
+                cached_black_proxy = None
         except Exception as e:
             print(f"Erro ao regenerar cache de imagens: {e}")
         update_g1_preview()
 
     def update_g1_preview():
         nonlocal canvas_image_id
-        if not cached_g1_original: return
+        if not cached_g1_proxy: return
         
-        if no_color_var.get():
-            img_colorida = cached_g1_original
+        opacidade_percent = opacidade_var.get()
+        if cached_black_proxy is None:
+            # Preto sólido: a opacidade é um escurecimento uniforme, sem blend
+            if no_color_var.get():
+                img_colorida = escurecer(cached_g1_proxy, opacidade_percent)
+            else:
+                img_colorida = colorir_g1(cached_g1_proxy_l, hex_var.get(), opacidade_percent)
+            opacidade_percent = 0
+        elif no_color_var.get():
+            img_colorida = cached_g1_proxy
         else:
-            cor_valida = hex_var.get()
-            img_base_l = cached_g1_original.convert("L")
-            img_colorida = ImageOps.colorize(img_base_l, black="black", white=cor_valida).convert("RGBA")
+            img_colorida = colorir_g1(cached_g1_proxy_l, hex_var.get())
 
-        opacidade_percent = opacidade_var.get()
         if opacidade_percent > 0:
             alpha = opacidade_percent / 100.0
-            img_final = Image.blend(img_colorida, cached_black_img, alpha)
+            img_final = Image.blend(img_colorida, cached_black_proxy, alpha)
         else:
             img_final = img_colorida
 
         canvas_w = canvas_preview.winfo_width()
         canvas_h = canvas_preview.winfo_height()
         if canvas_w <= 1 or canvas_h <= 1: return
-        
-        final_w, final_h = img_final.size
-        final_aspect_ratio = final_w / final_h
-        if canvas_w / canvas_h > final_aspect_ratio:
-            new_h = canvas_h
-            new_w = int(new_h * final_aspect_ratio)
-        else:
-            new_w = canvas_w
-            new_h = int(new_w / final_aspect_ratio)
-            
-        img_resized = img_final.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        img_tk = ImageTk.PhotoImage(img_resized)
+
+        img_tk = ImageTk.PhotoImage(img_final)
         if canvas_image_id:
             canvas_preview.delete(canvas_image_id)
         canvas_image_id = canvas_preview.create_image(canvas_w/2, canvas_h/2, image=img_tk, anchor="center")
@@ -195,14 +304,14 @@ def abrir_janela_edicao_g1():
         cor_inserida = hex_var.get()
         if re.match(r'^#[0-9a-fA-F]{6}$', cor_inserida):
             cor_preview_local.config(bg=cor_inserida)
-            update_g1_preview()
+            agendador_preview.agendar()
 
     def on_opacity_change(*args):
         try:
             valor = opacidade_var.get()
             if valor < 0: opacidade_var.set(0)
             if valor > 100: opacidade_var.set(100)
-            update_g1_preview()
+            agendador_preview.agendar()
         except tk.TclError:
             pass
 
@@ -217,17 +326,16 @@ def abrir_janela_edicao_g1():
         if caminho:
             novo_caminho_selecionado = caminho
             logger.log(f"Nova imagem '{os.path.basename(caminho)}' selecionada para substituir g1.png.")
+            # A camada de escurecimento volta a ser preto sólido, que não precisa de arquivo:
+            # sem black.png a opacidade é aplicada diretamente sobre as cores
             try:
-                imagem_selecionada = Image.open(caminho)
-                largura, altura = imagem_selecionada.size
-                imagem_preta = Image.new('RGB', (largura, altura), color='black')
-                pasta_preset = os.path.dirname(caminho_g1_original)
-                caminho_black_png = os.path.join(pasta_preset, "black.png")
-                imagem_preta.save(caminho_black_png, "PNG")
-                logger.log(f"Imagem black.png criada/atualizada com sucesso no tamanho {largura}x{altura}.")
+                if os.path.exists(caminho_black_png):
+                    os.remove(caminho_black_png)
+                    logger.log("Imagem black.png removida; a opacidade passa a usar preto sólido.")
             except Exception as e:
-                logger.log(f"ERRO ao criar black.png: {e}")
-                messagebox.showerror("Erro", f"Não foi possível criar a imagem black.png: {e}")
+                logger.log(f"ERRO ao remover black.png: {e}")
+                messagebox.showerror("Erro", f"Não foi possível remover a imagem black.png: {e}")
+            carregar_fontes()
             regenerate_caches()
 
     def aplicar_e_fechar():
@@ -237,25 +345,26 @@ def abrir_janela_edicao_g1():
             return
         if PRESETS[preset_atual]["color"] != cor_final:
             PRESETS[preset_atual]["color"] = cor_final
-            salvar_presets(PRESETS, DATA_FILE)
+            armazem_presets.marcar(PRESETS, preset_atual)
             logger.log(f"Cor do preset '{preset_atual}' salva como {cor_final}.")
             
         opacidade_final = opacidade_var.get()
         if PRESETS[preset_atual].get("opacidade", 0) != opacidade_final:
             PRESETS[preset_atual]["opacidade"] = opacidade_final
-            salvar_presets(PRESETS, DATA_FILE)
+            armazem_presets.marcar(PRESETS, preset_atual)
             logger.log(f"Opacidade do preset '{preset_atual}' salva como {opacidade_final}%.")
 
         no_color_final = no_color_var.get()
         if PRESETS[preset_atual].get("no_color", False) != no_color_final:
             PRESETS[preset_atual]["no_color"] = no_color_final
-            salvar_presets(PRESETS, DATA_FILE)
+            armazem_presets.marcar(PRESETS, preset_atual)
             logger.log(f"Opção 'no color' do preset '{preset_atual}' salva como {no_color_final}.")
 
         if novo_caminho_selecionado:
             try:
+                # A g1 pode ser compartilhada com outros presets: o arquivo é substituído, não sobrescrito
                 nova_imagem = Image.open(novo_caminho_selecionado)
-                nova_imagem.save(caminho_g1_original, "PNG")
+                salvar_imagem_no_preset(nova_imagem, caminho_g1_original, BASE_DIR)
                 logger.log(f"Imagem g1.png do preset '{preset_atual}' foi substituída.")
             except Exception as e:
                 messagebox.showerror("Erro ao Salvar Imagem", f"Não foi possível salvar a nova imagem g1.png: {e}")
@@ -270,9 +379,12 @@ def abrir_janela_edicao_g1():
         editor_g1_window.destroy()
 
     # --- CHAMADAS FINAIS ---
+    # Rajadas de eventos viram uma única atualização com o estado mais recente
+    agendador_preview = AgendadorTk(editor_g1_window, update_g1_preview)
+    agendador_proxy = AgendadorTk(editor_g1_window, regenerate_caches, atraso=50)
     hex_var.trace_add("write", on_hex_var_change)
     opacidade_var.trace_add("write", on_opacity_change)
-    canvas_preview.bind("<Configure>", lambda e: regenerate_caches())
+    canvas_preview.bind("<Configure>", lambda e: agendador_proxy.agendar())
     editor_g1_window.protocol("WM_DELETE_WINDOW", fechar_sem_salvar)
     editor_g1_window.after(100, regenerate_caches)
     logger.log(f"Janela de edição de cor aberta para o preset '{preset_atual}'.")
@@ -307,11 +419,15 @@ def excluir_preset_selecionado():
         
         # 5. Apagar a pasta e todo o seu conteúdo.
         if os.path.exists(caminho_pasta):
+            remover_miniaturas([arquivo.path for arquivo in os.scandir(caminho_pasta)], BASE_DIR)
             shutil.rmtree(caminho_pasta)
             logger.log(f"Pasta '{caminho_pasta}' excluída com sucesso.")
+            # Só saem da loja as imagens que nenhum outro preset usa
+            apagados, liberados = limpar_loja(BASE_DIR)
+            logger.log(f"{apagados} arquivos sem uso removidos da loja ({liberados / 1024:.0f} KB liberados).")
 
         # 6. Salvar as alterações no arquivo JSON.
-        salvar_presets(PRESETS, DATA_FILE)
+        armazem_presets.marcar(PRESETS, preset_selecionado)
         
         # 7. Atualizar a interface gráfica.
         logger.log("Atualizando a interface após a exclusão.")
@@ -329,9 +445,21 @@ def atualizar_mostrar_fundo():
     preset = preset_var.get()
     if preset in PRESETS:
         PRESETS[preset]["mostrar_fundo"] = bool(mostrar_fundo_var.get())
-        salvar_presets(PRESETS, DATA_FILE) # <--- CHAMADA DA FUNÇÃO IMPORTADA
+        armazem_presets.marcar(PRESETS, preset)
         atualizar_galeria(imagens_atuais)
 
+def atualizar_saida(event=None):
+    preset = preset_var.get()
+    if preset in PRESETS:
+        saida = PRESETS[preset].get("saida")
+        if isinstance(saida, dict):
+            # Mantém os ajustes do preset (ex.: qualidade) e troca só o perfil
+            PRESETS[preset]["saida"] = {**saida, "perfil": saida_var.get()}
+        else:
+            PRESETS[preset]["saida"] = saida_var.get()
+        armazem_presets.marcar(PRESETS, preset)
+        logger.log(f"Saída do preset '{preset}' alterada para '{saida_var.get()}'.")
+
 def novo_preset():
     logger.log(f"Tentativa de criar novo preset.")
     nome = simpledialog.askstring("Novo Preset", "Digite o nome do novo preset:")
@@ -350,17 +478,18 @@ def novo_preset():
     pasta_preset = os.path.join(BASE_DIR, codigo)
     os.makedirs(pasta_preset, exist_ok=True)
 
+    # As imagens de raws/ entram no preset como links da loja, sem copiar os dados
     pasta_raws = os.path.join(BASE_DIR, "raws")
     if os.path.exists(pasta_raws):
         for arquivo in os.listdir(pasta_raws):
             origem = os.path.join(pasta_raws, arquivo)
             destino = os.path.join(pasta_preset, arquivo)
             if os.path.isfile(origem):
-                shutil.copy2(origem, destino)
+                vincular_da_loja(origem, destino, BASE_DIR)
 
     PRESETS[nome] = {"code": codigo, "color": "#FFFFFF", "mostrar_fundo": False}
     logger.log(f"Preset '{nome}' criado com sucesso. Código: {codigo}.")
-    salvar_presets(PRESETS, DATA_FILE) # <--- CHAMADA DA FUNÇÃO IMPORTADA
+    armazem_presets.marcar(PRESETS, nome)
     
     atualizar_lista_presets()
     preset_var.set(nome)
@@ -376,7 +505,7 @@ def escolher_cor():
         if preset_selecionado in PRESETS:
             PRESETS[preset_selecionado]["color"] = cor
             logger.log(f"Cor do preset '{preset_selecionado}' alterada para {cor}.")
-            salvar_presets(PRESETS, DATA_FILE) # <--- CHAMADA DA FUNÇÃO IMPORTADA
+            armazem_presets.marcar(PRESETS, preset_selecionado)
             atualizar_galeria(imagens_atuais)
 
 def acao_excluir_imagem(caminho_da_imagem):
@@ -389,10 +518,12 @@ def acao_excluir_imagem(caminho_da_imagem):
     if messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir a imagem '{nome_arquivo}'?"):
         try:
             os.remove(caminho_da_imagem)
+            limpar_loja(BASE_DIR)
+            remover_miniaturas([caminho_da_imagem], BASE_DIR)
             logger.log(f"Imagem '{nome_arquivo}' foi excluída com sucesso.")
             
-            # A forma mais fácil de atualizar a galeria é chamar a função que a carrega
-            mudar_preset() 
+            # Só o quadro da imagem excluída sai da galeria
+            sincronizar_pasta()
             
         except Exception as e:
             messagebox.showerror("Erro", f"Não foi possível excluir a imagem: {e}")
@@ -464,6 +595,8 @@ def acao_editar_imagem(caminho_original):
                 new_w = canvas_w
                 new_h = int(new_w / prev_aspect_ratio)
             
+            # Decodifica já perto do tamanho do canvas em vez de em resolução real
+            imagem_pil_preview = carregar_reduzida(caminho_para_mostrar, (new_w, new_h))
             img_resized = imagem_pil_preview.resize((new_w, new_h), Image.Resampling.LANCZOS)
             img_tk = ImageTk.PhotoImage(img_resized)
             
@@ -500,13 +633,13 @@ def acao_editar_imagem(caminho_original):
                 os.remove(caminho_original)
                 logger.log(f"Arquivo original '{os.path.basename(caminho_original)}' removido.")
 
-            nova_imagem.save(caminho_final, "PNG")
+            salvar_imagem_no_preset(nova_imagem, caminho_final, BASE_DIR)
             logger.log(f"Nova imagem salva como '{os.path.basename(caminho_final)}'.")
             
             # --- POPUP REMOVIDO ---
             
             editor_window.destroy()
-            mudar_preset()
+            sincronizar_pasta()
         except Exception as e:
             messagebox.showerror("Erro na Substituição", f"Ocorreu um erro: {e}")
             logger.log(f"ERRO ao substituir imagem: {e}")
@@ -538,7 +671,8 @@ def acao_editar_imagem(caminho_original):
 
     # --- Chamadas Iniciais e Binds ---
     editor_window.after(100, atualizar_preview) 
-    preview_canvas.bind("<Configure>", lambda e: atualizar_preview())
+    agendador_preview = AgendadorTk(editor_window, atualizar_preview, atraso=50)
+    preview_canvas.bind("<Configure>", lambda e: agendador_preview.agendar())
     editor_window.protocol("WM_DELETE_WINDOW", fechar_sem_salvar)
     logger.log(f"Janela de edição aberta para o arquivo '{os.path.basename(caminho_original)}'.")
 
@@ -615,103 +749,355 @@ def abrir_janela_adicionar_imagem():
         
         # Abre a imagem selecionada e a salva como PNG no destino
         imagem_para_adicionar = Image.open(novo_caminho)
-        imagem_para_adicionar.save(caminho_final, "PNG")
+        salvar_imagem_no_preset(imagem_para_adicionar, caminho_final, BASE_DIR)
         
         logger.log(f"Imagem '{os.path.basename(caminho_final)}' adicionada ao preset '{preset_atual}'.")
         messagebox.showinfo("Sucesso", "Nova imagem adicionada com sucesso!")
         
         # Atualiza a galeria para mostrar a nova imagem
-        mudar_preset()
+        sincronizar_pasta()
 
     except Exception as e:
         messagebox.showerror("Erro ao Adicionar Imagem", f"Ocorreu um erro: {e}")
         logger.log(f"ERRO ao adicionar nova imagem: {e}")
 
-def atualizar_galeria(imagens):
-    for widget in galeria_inner.winfo_children():
-        widget.destroy()
+# --- GALERIA VIRTUALIZADA ---
+# Cada célula tem o quadro de 150x100 mais 5px de espaçamento de cada lado
+GALERIA_COLUNAS = 5
+GALERIA_CELULA_W = 160
+GALERIA_CELULA_H = 110
+GALERIA_MARGEM_LINHAS = 2 # Linhas extras criadas acima e abaixo da área visível
+GALERIA_WORKERS = 4 # Threads que geram as miniaturas em segundo plano
+GALERIA_INTERVALO_DRENAGEM = 15 # ms entre as verificações da fila de miniaturas prontas
+
+class TileGaleria:
+    """
+    Um quadro da galeria (miniatura + botões de excluir/editar). Os quadros são
+    reaproveitados durante a rolagem e as atualizações: só as imagens e o arquivo
+    associado mudam, sem recriar os widgets.
+    """
+    def __init__(self, master):
+        self.nome = None
+        self.caminho = None
+        self.imagens_tk = None
+
+        btn_size = 15
+        self.frame = tk.Frame(master, width=150, height=100, bd=2, relief="solid")
+        self.frame.grid_propagate(False)
+        self.canvas = tk.Canvas(self.frame, width=146, height=96, highlightthickness=0)
+        self.item_imagem = self.canvas.create_image(0, 0, anchor="nw")
+        self.canvas.place(x=0, y=0)
+
+        # Lógica dos botões de editar/excluir: o fundo de cada botão é o recorte da miniatura
+        self.pos_delete = (5, 5)
+        self.pos_edit = (25, 5)
+        self.botao_excluir = criar_botao_com_icone(self.frame, icon_image_tk=icon_delete_tk, command=self.excluir, size=btn_size)
+        self.item_fundo_excluir = self.botao_excluir.create_image(0, 0, anchor="nw")
+        self.botao_excluir.tag_lower(self.item_fundo_excluir)
+        self.botao_excluir.place(x=self.pos_delete[0], y=self.pos_delete[1])
+        self.botao_editar = criar_botao_com_icone(self.frame, icon_image_tk=icon_edit_tk, command=self.editar, size=btn_size)
+        self.item_fundo_editar = self.botao_editar.create_image(0, 0, anchor="nw")
+        self.botao_editar.tag_lower(self.item_fundo_editar)
+        self.botao_editar.place(x=self.pos_edit[0], y=self.pos_edit[1])
+
+    def mostrar(self, nome, caminho, imagens_tk):
+        """Associa o quadro a outro arquivo, trocando as imagens no lugar."""
+        self.nome = nome
+        self.caminho = caminho
+        self.imagens_tk = imagens_tk # Mantém a referência para o garbage collector não apagar
+        img_tk, bg_delete_tk, bg_edit_tk = imagens_tk
+        self.canvas.itemconfig(self.item_imagem, image=img_tk)
+        self.botao_excluir.itemconfig(self.item_fundo_excluir, image=bg_delete_tk)
+        self.botao_editar.itemconfig(self.item_fundo_editar, image=bg_edit_tk)
+
+    def excluir(self):
+        acao_excluir_imagem(self.caminho)
+
+    def editar(self):
+        if self.nome == "g1.png":
+            abrir_janela_edicao_g1()
+        else:
+            acao_editar_imagem(self.caminho)
+
+class GaleriaVirtual:
+    """
+    Grade da galeria que só cria os quadros da área visível (mais uma margem) e
+    os recicla durante a rolagem, em vez de manter um widget por imagem.
+
+    As miniaturas são geradas por threads em segundo plano: cada quadro aparece
+    na hora com um placeholder e recebe a imagem quando ela fica pronta. Os
+    resultados chegam por uma fila drenada com after(); ao trocar de preset, os
+    pedidos antigos são cancelados e os que já estavam rodando são descartados.
+    """
+    def __init__(self, canvas, inner):
+        self.canvas = canvas
+        self.inner = inner
+        self.imagens = []
+        self.miniaturas = {} # caminho -> (img_tk, bg_delete_tk, bg_edit_tk)
+        self.tiles_ativos = {} # índice da imagem -> TileGaleria
+        self.tiles_livres = []
+        self.agendador = AgendadorTk(canvas, self.atualizar_visiveis)
+        self.frame_add = self._criar_frame_add()
+
+        # Carregamento em segundo plano
+        self.geracao = 0 # Incrementada a cada troca de conteúdo; resultados de gerações antigas são descartados
+        self.preset_fundo = None
+        self.pedidos = {} # caminho -> Future da geração atual
+        self.falhas = {} # caminho -> mtime_ns do arquivo que não pôde ser lido (não é tentado de novo até mudar)
+        self.resultados = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=GALERIA_WORKERS)
+        self._lock_fundo = threading.Lock()
+        self._fundo_geracao = None
+        self._fundo = None
+        self._drenagem_agendada = False
+        self.placeholder = self._criar_imagens_tk(Image.new("RGBA", (146, 96), "#D0D0D0"))
+
+    def _criar_frame_add(self):
+        # Frame de "Adicionar nova imagem"
+        frame_add = tk.Frame(self.inner, width=150, height=100, bd=2, relief="solid", bg="#E5E5E5")
+        frame_add.grid_propagate(False)
+        icon_add = criar_botao_com_icone(frame_add, icon_image_tk=icon_add_tk, background_color="#E5E5E5", size=50)
+        icon_add.place(relx=0.5, rely=0.4, anchor="center")
+        label_add = tk.Label(frame_add, text="Adicionar nova\nimagem", bg="#E5E5E5", fg="black")
+        label_add.place(relx=0.5, rely=0.8, anchor="center")
+        comando_clique = lambda e: abrir_janela_adicionar_imagem()
+        frame_add.bind("<Button-1>", comando_clique)
+        icon_add.bind("<Button-1>", comando_clique)
+        for child in icon_add.winfo_children():
+            child.bind("<Button-1>", comando_clique)
+        label_add.bind("<Button-1>", comando_clique)
+        return frame_add
+
+    def _posicao(self, indice):
+        linha, coluna = divmod(indice, GALERIA_COLUNAS)
+        return coluna * GALERIA_CELULA_W + 5, linha * GALERIA_CELULA_H + 5
+
+    def definir_imagens(self, imagens, preset_fundo):
+        """
+        Troca o conteúdo da galeria; os quadros já criados são reaproveitados.
+        'preset_fundo' é o preset cuja g1 vai de fundo nas miniaturas (ou None).
+        """
+        self.geracao += 1
+        for futuro in self.pedidos.values():
+            futuro.cancel()
+        self.pedidos.clear()
+
+        self.imagens = list(imagens)
+        self.preset_fundo = dict(preset_fundo) if preset_fundo else None
+        self.miniaturas.clear()
+        self._dimensionar()
+        self.atualizar_visiveis(forcar=True)
+
+    def atualizar_arquivo(self, imagens, caminho):
+        """
+        Aplica a mudança de um único arquivo (adicionado, modificado ou removido):
+        só a miniatura de 'caminho' é descartada; os outros quadros mantêm as suas
+        e apenas mudam de posição se a lista andou.
+        """
+        self.geracao += 1 # Uma miniatura antiga de 'caminho' que ainda esteja sendo gerada é descartada
+        for futuro in self.pedidos.values():
+            futuro.cancel()
+        self.pedidos.clear()
+
+        self.imagens = list(imagens)
+        self.miniaturas.pop(caminho, None)
+        self._dimensionar()
+        self.atualizar_visiveis(forcar=True)
+
+    def _dimensionar(self):
+        total = len(self.imagens) + 1 # +1 pelo quadro de adicionar
+        linhas = (total + GALERIA_COLUNAS - 1) // GALERIA_COLUNAS
+        self.inner.configure(width=GALERIA_COLUNAS * GALERIA_CELULA_W, height=linhas * GALERIA_CELULA_H)
+        x, y = self._posicao(len(self.imagens))
+        self.frame_add.place(x=x, y=y)
+
+    def _intervalo_visivel(self, margem):
+        topo = self.canvas.canvasy(0)
+        altura = max(self.canvas.winfo_height(), GALERIA_CELULA_H)
+        primeira_linha = max(0, int(topo // GALERIA_CELULA_H) - margem)
+        ultima_linha = int((topo + altura) // GALERIA_CELULA_H) + margem
+        inicio = primeira_linha * GALERIA_COLUNAS
+        fim = min(len(self.imagens), (ultima_linha + 1) * GALERIA_COLUNAS)
+        return range(inicio, fim)
+
+    def atualizar_visiveis(self, forcar=False):
+        """Garante um quadro para cada imagem visível e devolve ao pool os que saíram da tela."""
+        visiveis = self._intervalo_visivel(GALERIA_MARGEM_LINHAS)
+        for indice in [i for i in self.tiles_ativos if i not in visiveis]:
+            tile = self.tiles_ativos.pop(indice)
+            tile.frame.place_forget()
+            self.tiles_livres.append(tile)
+
+        # As miniaturas da área realmente visível são pedidas antes das da margem
+        na_tela = self._intervalo_visivel(0)
+        ordem = list(na_tela) + [i for i in visiveis if i not in na_tela]
+        for indice in ordem:
+            nome, caminho = self.imagens[indice]
+            tile = self.tiles_ativos.get(indice)
+            if tile is not None and not forcar and tile.caminho == caminho:
+                continue
+            if tile is None:
+                tile = self.tiles_livres.pop() if self.tiles_livres else TileGaleria(self.inner)
+                self.tiles_ativos[indice] = tile
+                x, y = self._posicao(indice)
+                tile.frame.place(x=x, y=y)
+            if caminho in self.miniaturas:
+                tile.mostrar(nome, caminho, self.miniaturas[caminho])
+            else:
+                # Numa atualização do mesmo arquivo a miniatura antiga fica até a nova chegar
+                if tile.caminho != caminho:
+                    tile.mostrar(nome, caminho, self.placeholder)
+                self._pedir_miniatura(nome, caminho)
+
+    def _criar_imagens_tk(self, final_pil):
+        return (
+            ImageTk.PhotoImage(final_pil),
+            ImageTk.PhotoImage(final_pil.crop((5, 5, 20, 20))),
+            ImageTk.PhotoImage(final_pil.crop((25, 5, 40, 20))),
+        )
+
+    def _pedir_miniatura(self, nome, caminho):
+        if caminho in self.pedidos:
+            return
+        if caminho in self.falhas:
+            if self.falhas[caminho] == _mtime_ns(caminho):
+                return # Já falhou com este mesmo arquivo
+            del self.falhas[caminho]
+        self.pedidos[caminho] = self.executor.submit(self._trabalho_miniatura, self.geracao, self.preset_fundo, nome, caminho)
+        if not self._drenagem_agendada:
+            self._drenagem_agendada = True
+            self.canvas.after(GALERIA_INTERVALO_DRENAGEM, self._drenar_resultados)
+
+    def _fundo_da_geracao(self, geracao, preset_fundo):
+        """Miniatura do fundo, calculada uma única vez por geração (na primeira thread que precisar)."""
+        with self._lock_fundo:
+            if self._fundo_geracao != geracao:
+                self._fundo = None
+                if preset_fundo:
+                    try:
+                        # A g1 reduzida fica em cache; trocar cor/opacidade só recalcula a paleta
+                        self._fundo = miniatura_fundo(preset_fundo, BASE_DIR, (146, 96))
+                    except Exception as e:
+                        print(f"Erro ao gerar o fundo da galeria: {e}")
+                self._fundo_geracao = geracao
+            return self._fundo
+
+    def _trabalho_miniatura(self, geracao, preset_fundo, nome, caminho):
+        """Roda em uma thread de fundo: só usa PIL, nunca o Tk."""
+        if geracao != self.geracao:
+            return # Pedido de uma geração que já foi substituída
+        try:
+            final_pil = gerar_miniatura_galeria(nome, caminho, self._fundo_da_geracao(geracao, preset_fundo), BASE_DIR)
+        except Exception as e:
+            print(f"Erro ao gerar miniatura de '{nome}': {e}")
+            self.falhas[caminho] = _mtime_ns(caminho)
+            final_pil = None
+        self.resultados.put((geracao, caminho, final_pil))
+
+    def _drenar_resultados(self):
+        """Roda na thread do Tk: entrega aos quadros as miniaturas que ficaram prontas."""
+        while True:
+            try:
+                geracao, caminho, final_pil = self.resultados.get_nowait()
+            except queue.Empty:
+                break
+            if geracao != self.geracao:
+                continue
+            self.pedidos.pop(caminho, None)
+            if final_pil is None:
+                continue
+            self.miniaturas[caminho] = self._criar_imagens_tk(final_pil)
+            for tile in self.tiles_ativos.values():
+                if tile.caminho == caminho:
+                    tile.mostrar(tile.nome, caminho, self.miniaturas[caminho])
+
+        # Limpa pedidos que nunca vão responder (cancelados antes de começar)
+        for caminho in [c for c, f in self.pedidos.items() if f.cancelled()]:
+            del self.pedidos[caminho]
+        if self.pedidos:
+            self.canvas.after(GALERIA_INTERVALO_DRENAGEM, self._drenar_resultados)
+        else:
+            self._drenagem_agendada = False
+
+    def encerrar(self):
+        """Cancela o que ainda não começou e libera as threads (ao fechar o programa)."""
+        self.geracao += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _mtime_ns(caminho):
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except OSError:
+        return None
 
-    row, col = 0, 0
+def atualizar_galeria(imagens):
     preset_nome = preset_var.get()
     
-    if preset_nome not in PRESETS: return
+    if preset_nome not in PRESETS:
+        galeria.definir_imagens([], None)
+        return
 
     preset_info = PRESETS[preset_nome]
 
-    # Carrega a base do fundo uma vez, se a opção estiver marcada
-    g1_base_para_fundo = None
-    if mostrar_fundo_var.get():
-        caminho_g1 = os.path.join(BASE_DIR, preset_info["code"], "g1.png")
-        if os.path.exists(caminho_g1):
-            # Processa a g1 em tamanho real para usar como fundo
-            fundo_processado = gerar_imagem_final(preset_info, caminho_g1, BASE_DIR)
-            if fundo_processado:
-                # Redimensiona para o tamanho do thumbnail
-                g1_base_para_fundo = fundo_processado.resize((146, 96), Image.Resampling.LANCZOS)
-
-
-    for nome, caminho in imagens:
-        frame = tk.Frame(galeria_inner, width=150, height=100, bd=2, relief="solid")
-        frame.grid(row=row, column=col, padx=5, pady=5)
-        frame.grid_propagate(False)
-
-        # Se a imagem atual for a g1.png, o thumbnail dela é a própria base de fundo
-        if nome == "g1.png" and g1_base_para_fundo:
-            final_pil = g1_base_para_fundo
-        else:
-            # Para as outras imagens, carrega e as coloca sobre a base de fundo
-            imagem_principal_pil = Image.open(caminho).resize((146, 96)).convert("RGBA")
-            if g1_base_para_fundo:
-                fundo = g1_base_para_fundo.copy()
-                fundo.paste(imagem_principal_pil, (0, 0), imagem_principal_pil)
-                final_pil = fundo
-            else:
-                final_pil = imagem_principal_pil
+    # O fundo (g1) só é usado se a opção estiver marcada; ele é calculado junto com as miniaturas
+    preset_fundo = preset_info if mostrar_fundo_var.get() else None
 
-        img_tk = ImageTk.PhotoImage(final_pil)
-        canvas = tk.Canvas(frame, width=146, height=96, highlightthickness=0)
-        canvas.create_image(0, 0, image=img_tk, anchor="nw")
-        canvas.image = img_tk
-        canvas.place(x=0, y=0)
+    # Só os quadros visíveis são montados; os existentes são atualizados no lugar
+    # e recebem as miniaturas conforme as threads de fundo as terminam
+    galeria.definir_imagens(imagens, preset_fundo)
 
-        # Lógica dos botões de editar/excluir
-        btn_size = 15
-        pos_delete = (5, 5)
-        pos_edit = (25, 5)
-        bg_delete_pil = final_pil.crop((pos_delete[0], pos_delete[1], pos_delete[0] + btn_size, pos_delete[1] + btn_size))
-        bg_delete_tk = ImageTk.PhotoImage(bg_delete_pil)
-        bg_edit_pil = final_pil.crop((pos_edit[0], pos_edit[1], pos_edit[0] + btn_size, pos_edit[1] + btn_size))
-        bg_edit_tk = ImageTk.PhotoImage(bg_edit_pil)
-        canvas.bg_delete = bg_delete_tk
-        canvas.bg_edit = bg_edit_tk
-        comando_excluir = lambda c=caminho: acao_excluir_imagem(c)
-        botao_excluir = criar_botao_com_icone(frame, icon_image_tk=icon_delete_tk, background_image_tk=bg_delete_tk, command=comando_excluir, size=btn_size)
-        botao_excluir.place(x=pos_delete[0], y=pos_delete[1])
-        if nome == "g1.png":
-            comando_editar = lambda: abrir_janela_edicao_g1()
+# --- OBSERVAÇÃO DA PASTA DO PRESET ---
+
+def observar_pasta(pasta):
+    """Troca a pasta observada; eventos da pasta anterior que ainda estejam na fila são ignorados."""
+    global observador
+    if observador is not None:
+        if observador.pasta == pasta:
+            return
+        observador.parar()
+    observador = ObservadorPasta(pasta, lambda pasta, evento, nome: eventos_pasta.put((pasta, evento, nome)))
+    observador.iniciar()
+    logger.log(f"Observando '{pasta}' ({observador.modo}).")
+
+def sincronizar_pasta():
+    """Verifica a pasta agora (depois de o próprio programa alterá-la) e aplica as mudanças na galeria."""
+    if observador is not None:
+        observador.verificar()
+    aplicar_eventos_pasta()
+
+def aplicar_eventos_pasta():
+    """Roda na thread do Tk: atualiza a lista de imagens e só os quadros dos arquivos que mudaram."""
+    global imagens_atuais
+    preset_nome = preset_var.get()
+    while True:
+        try:
+            pasta, evento, nome = eventos_pasta.get_nowait()
+        except queue.Empty:
+            break
+        if observador is None or pasta != observador.pasta or preset_nome not in PRESETS:
+            continue
+
+        nome_lower = nome.lower()
+        caminho = os.path.join(pasta, nome)
+        # Mesmas regras de carregar_imagens: black.png e variações de maiúsculas de g1.png não aparecem
+        if nome_lower != "black.png" and (nome_lower != "g1.png" or nome == "g1.png"):
+            imagens_atuais = [item for item in imagens_atuais if item[0] != nome]
+            if evento != "removida":
+                imagens_atuais.append((nome, caminho))
+                imagens_atuais.sort(key=lambda item: (item[0] != "g1.png", item[0]))
+        if evento == "removida":
+            remover_miniaturas([caminho], BASE_DIR) # Também quando o arquivo é apagado por fora do programa
+        logger.log(f"Arquivo '{nome}' {evento} no preset '{preset_nome}'.")
+
+        if nome in ("g1.png", "black.png") and mostrar_fundo_var.get():
+            # O fundo de todas as miniaturas mudou
+            atualizar_galeria(imagens_atuais)
         else:
-            comando_editar = lambda c=caminho: acao_editar_imagem(c)
-        botao_editar = criar_botao_com_icone(frame, icon_image_tk=icon_edit_tk, background_image_tk=bg_edit_tk, command=comando_editar, size=btn_size)
-        botao_editar.place(x=pos_edit[0], y=pos_edit[1])
-
-        col += 1
-        if col >= 5:
-            col, row = 0, row + 1
-
-    # Frame de "Adicionar nova imagem"
-    frame_add = tk.Frame(galeria_inner, width=150, height=100, bd=2, relief="solid", bg="#E5E5E5")
-    frame_add.grid(row=row, column=col, padx=5, pady=5)
-    frame_add.grid_propagate(False)
-    icon_add = criar_botao_com_icone(frame_add, icon_image_tk=icon_add_tk, background_color="#E5E5E5", size=50)
-    icon_add.place(relx=0.5, rely=0.4, anchor="center")
-    label_add = tk.Label(frame_add, text="Adicionar nova\nimagem", bg="#E5E5E5", fg="black")
-    label_add.place(relx=0.5, rely=0.8, anchor="center")
-    comando_clique = lambda e: abrir_janela_adicionar_imagem()
-    frame_add.bind("<Button-1>", comando_clique)
-    icon_add.bind("<Button-1>", comando_clique)
-    for child in icon_add.winfo_children():
-        child.bind("<Button-1>", comando_clique)
-    label_add.bind("<Button-1>", comando_clique)
+            galeria.atualizar_arquivo(imagens_atuais, caminho)
+
+def verificar_eventos_pasta():
+    aplicar_eventos_pasta()
+    janela.after(INTERVALO_EVENTOS_PASTA, verificar_eventos_pasta)
 
 def mudar_preset(event=None):
     global imagens_atuais, cor_selecionada
@@ -730,12 +1116,33 @@ def mudar_preset(event=None):
 
     # <--- CHAMADA DA FUNÇÃO IMPORTADA
     imagens_atuais = carregar_imagens(PRESETS[preset]["code"], BASE_DIR)
+    observar_pasta(os.path.join(BASE_DIR, PRESETS[preset]["code"]))
+    # Hash e caixa do alpha das imagens novas são calculados em segundo plano, para a próxima geração
+    threading.Thread(target=carregar_indice, args=(os.path.join(BASE_DIR, PRESETS[preset]["code"]),), daemon=True).start()
     
     cor_selecionada = PRESETS[preset]["color"]
     mostrar_fundo_var.set(1 if PRESETS[preset].get("mostrar_fundo", False) else 0)
+    saida_var.set(perfil_saida(PRESETS[preset].get("saida")))
     cor_preview.config(bg=cor_selecionada)
     atualizar_galeria(imagens_atuais)
 
+def finalizar_cronometragem(descricao):
+    """Manda para o log o resumo do tempo por etapa da geração (e salva o trace, se configurado)."""
+    cronometro = parar_cronometro()
+    if cronometro is None:
+        return
+    logger.log(f"Tempo por etapa ({descricao}):")
+    for linha in cronometro.linhas_resumo():
+        logger.log(f"  {linha}")
+    if SALVAR_TRACE_GERACAO:
+        caminho_trace = os.path.join(logger.log_directory, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            cronometro.exportar_trace(caminho_trace)
+            logger.add_file(caminho_trace) # Apagado junto com os logs antigos
+            logger.log(f"Trace da geração salvo em '{caminho_trace}'.")
+        except OSError as e:
+            logger.log(f"ERRO ao salvar o trace da geração: {e}")
+
 def gerar():
     """
     Pega o preset atual, processa todas as suas imagens e as salva na pasta 'output'.
@@ -757,40 +1164,92 @@ def gerar():
     pasta_preset = os.path.join(BASE_DIR, codigo_preset)
 
     # Lista todas as imagens no preset, exceto black.png
-    imagens_a_gerar = [f for f in os.listdir(pasta_preset) if f.lower().endswith((".png", ".jpg", ".jpeg")) and f.lower() != "black.png"]
+    imagens_a_gerar = [f for f in sorted(carregar_indice(pasta_preset, completo=False)) if f.lower() != "black.png"]
 
     total_imagens = len(imagens_a_gerar)
     imagens_geradas = 0
 
-    for i, nome_imagem in enumerate(imagens_a_gerar):
-        print(f"Processando {i+1}/{total_imagens}: {nome_imagem}")
-        caminho_imagem = os.path.join(pasta_preset, nome_imagem)
-        
-        # Usa a nova função para processar a imagem em tamanho real
-        imagem_final = gerar_imagem_final(preset_info, caminho_imagem, BASE_DIR)
+    # Processa g1/black uma única vez e reaproveita o fundo para todas as imagens
+    try:
+        contexto = ContextoRender(preset_info, BASE_DIR)
+        contexto.fundo # O fundo é carregado sob demanda; carrega aqui para um g1/black inválido virar um único erro
+    except Exception as e:
+        logger.log(f"ERRO ao preparar o fundo do preset '{preset_selecionado}': {e}")
+        messagebox.showerror("Erro", f"Não foi possível preparar o fundo do preset: {e}")
+        return
 
-        if imagem_final:
-            # Salva a imagem final na pasta 'output'
-            caminho_saida = os.path.join(pasta_output, nome_imagem)
-            try:
-                imagem_final.save(caminho_saida, "PNG")
+    # As imagens são geradas em paralelo; os resultados chegam na ordem da lista
+    caminhos = [os.path.join(pasta_preset, nome_imagem) for nome_imagem in imagens_a_gerar]
+    if CRONOMETRAR_GERACAO:
+        iniciar_cronometro()
+    resultados = renderizar_lote(preset_info, caminhos, pasta_output, BASE_DIR, RENDER_WORKERS, contexto)
+    imagens_puladas = 0
+    try:
+        for i, (nome_imagem, situacao, erro) in enumerate(resultados):
+            print(f"Processando {i+1}/{total_imagens}: {nome_imagem} ({situacao})")
+            if situacao == "erro":
+                logger.log(f"ERRO ao salvar a imagem final '{nome_imagem}': {erro}")
+            else:
                 imagens_geradas += 1
-            except Exception as e:
-                logger.log(f"ERRO ao salvar a imagem final '{nome_imagem}': {e}")
+                if situacao != "gerada":
+                    imagens_puladas += 1
+    except ValueError as e:
+        # Configuração de saída inválida no presets.json
+        logger.log(f"ERRO na configuração de saída do preset '{preset_selecionado}': {e}")
+        messagebox.showerror("Erro", f"Configuração de saída inválida: {e}")
+        return
+    finally:
+        finalizar_cronometragem(f"preset '{preset_selecionado}'")
     
-    logger.log(f"Geração concluída. {imagens_geradas}/{total_imagens} imagens salvas em '{pasta_output}'.")
+    logger.log(f"Geração concluída. {imagens_geradas}/{total_imagens} imagens salvas em '{pasta_output}' ({imagens_puladas} sem alterações).")
     messagebox.showinfo("Processo Concluído", f"{imagens_geradas} de {total_imagens} imagens foram geradas com sucesso na pasta 'output'.")
 
+def gerar_todos():
+    """
+    Gera todos os presets de uma vez, cada um em 'output/<código>'. As imagens
+    iguais entre presets são decodificadas uma única vez.
+    """
+    logger.log("Iniciando processo de geração de todos os presets.")
+    pasta_output = os.path.join(BASE_DIR, "output")
+    os.makedirs(pasta_output, exist_ok=True)
+
+    estatisticas = {}
+    imagens_geradas = 0
+    total_imagens = 0
+    if CRONOMETRAR_GERACAO:
+        iniciar_cronometro()
+    try:
+        for nome_preset, nome_imagem, situacao, erro in renderizar_todos(PRESETS, BASE_DIR, pasta_output, RENDER_WORKERS, None, estatisticas):
+            total_imagens += 1
+            print(f"Processando {total_imagens}: [{nome_preset}] {nome_imagem} ({situacao})")
+            if situacao == "erro":
+                logger.log(f"ERRO ao salvar a imagem final '{nome_imagem}' do preset '{nome_preset}': {erro}")
+            else:
+                imagens_geradas += 1
+    except ValueError as e:
+        logger.log(f"ERRO na configuração de saída: {e}")
+        messagebox.showerror("Erro", f"Configuração de saída inválida: {e}")
+        return
+    finally:
+        finalizar_cronometragem("todos os presets")
+
+    logger.log(f"Geração de todos os presets concluída. {imagens_geradas}/{total_imagens} imagens salvas em '{pasta_output}' "
+               f"({estatisticas.get('decodificadas', 0)} imagens distintas decodificadas).")
+    messagebox.showinfo("Processo Concluído", f"{imagens_geradas} de {total_imagens} imagens de {len(PRESETS)} presets foram geradas com sucesso na pasta 'output'.")
+
 def posicionar_direita(event=None):
     largura_janela = janela.winfo_width()
     x_botao = largura_janela - 180
-    y1, y2, espacamento = 15, 55, 10
+    y1, y2, y3, espacamento = 15, 55, 95, 10
 
     btn_escolher_cor.place(x=x_botao, y=y1)
     cor_preview.place(x=x_botao + btn_escolher_cor.winfo_reqwidth() + espacamento, y=y1+2, width=20, height=20)
     label_mostrar.place(x=x_botao, y=y2)
     checkbox.place(x=x_botao + btn_escolher_cor.winfo_reqwidth() + espacamento, y=y2)
+    label_saida.place(x=x_botao, y=y3)
+    saida_menu.place(x=x_botao, y=y3 + 22)
     btn_gerar.place(x=largura_janela - 90, y=janela.winfo_height() - 40, width=80, height=30)
+    btn_gerar_todos.place(x=largura_janela - 190, y=janela.winfo_height() - 40, width=95, height=30)
 
 def atualizar_lista_presets():
     global lista_presets
@@ -801,7 +1260,13 @@ def atualizar_lista_presets():
 
 # --- INICIALIZAÇÃO DA APLICAÇÃO ---
 # Carregamento inicial de presets
-PRESETS = carregar_presets(DATA_FILE, DEFAULT_PRESET_DATA, DEFAULT_PRESET) # <--- CHAMADA DA FUNÇÃO IMPORTADA
+# As alterações são gravadas em segundo plano, juntando as feitas em sequência em uma gravação só
+armazem_presets = ArmazemPresets(os.path.join(BASE_DIR, "presets.db") if PRESETS_SQLITE else DATA_FILE)
+PRESETS = armazem_presets.carregar(DEFAULT_PRESET_DATA, DEFAULT_PRESET, importar_de=DATA_FILE) # <--- CHAMADA DA FUNÇÃO IMPORTADA
+if armazem_presets.origem == "importados":
+    logger.log(f"Presets importados de '{DATA_FILE}' para '{armazem_presets.caminho}'.")
+elif armazem_presets.origem == "padrao":
+    logger.log(f"Nenhum preset encontrado em '{armazem_presets.caminho}'; usando o preset padrão.")
 
 # Interface principal
 janela = tk.Tk()
@@ -840,12 +1305,14 @@ except FileNotFoundError:
 # Galeria com scroll
 galeria_canvas = tk.Canvas(janela, bg="#E5E5E5", highlightthickness=0)
 scrollbar = tk.Scrollbar(janela, orient="vertical", command=galeria_canvas.yview)
-galeria_canvas.configure(yscrollcommand=scrollbar.set)
 scrollbar.place(relx=0.75, y=60, relheight=0.75, anchor="nw")
 galeria_canvas.place(x=60, y=60, relwidth=0.7, relheight=0.75)
 galeria_inner = tk.Frame(galeria_canvas, bg="#E5E5E5")
 galeria_inner.bind("<Configure>", lambda e: galeria_canvas.configure(scrollregion=galeria_canvas.bbox("all")))
 galeria_canvas.create_window((0, 0), window=galeria_inner, anchor="nw")
+galeria = GaleriaVirtual(galeria_canvas, galeria_inner)
+# Sempre que a área visível muda (rolagem ou redimensionamento), os quadros são reciclados
+galeria_canvas.configure(yscrollcommand=lambda *args: (scrollbar.set(*args), galeria.agendador.agendar()))
 
 # Controles do topo
 icone_topo = criar_botao_com_icone(
@@ -869,7 +1336,6 @@ def alinhar_botoes_topo():
     btn_excluir_preset.place(x=x_pos, y=12, height=25)
 
 janela.after(100, alinhar_botoes_topo)
-janela.bind("<Configure>", lambda e: (posicionar_direita(e), alinhar_botoes_topo()), add='+')
 
 atualizar_lista_presets()
 preset_var.set(list(PRESETS.keys())[0])
@@ -881,12 +1347,22 @@ mostrar_fundo_var = IntVar()
 label_mostrar = tk.Label(janela, text="Mostrar fundo:", bg="#E5E5E5")
 checkbox = tk.Checkbutton(janela, variable=mostrar_fundo_var, command=atualizar_mostrar_fundo)
 btn_gerar = tk.Button(janela, text="Gerar", command=gerar)
+btn_gerar_todos = tk.Button(janela, text="Gerar todos", command=gerar_todos)
+# Perfil do codificador usado pelo preset (ver PERFIS_SAIDA em functions.py)
+saida_var = tk.StringVar(value=PERFIL_SAIDA_PADRAO)
+label_saida = tk.Label(janela, text="Saída:", bg="#E5E5E5")
+saida_menu = ttk.Combobox(janela, textvariable=saida_var, values=list(PERFIS_SAIDA), state="readonly", width=16)
+saida_menu.bind("<<ComboboxSelected>>", atualizar_saida)
 
 # Binds e chamadas iniciais
-janela.bind("<Configure>", posicionar_direita)
+# O <Configure> da janela principal dispara para todos os widgets filhos; as
+# rajadas são agrupadas em um único reposicionamento quando o Tk fica ocioso
+agendador_layout = AgendadorTk(janela, lambda: (posicionar_direita(), alinhar_botoes_topo()))
+janela.bind("<Configure>", lambda e: agendador_layout.agendar())
 # Configura o que acontece ao clicar no "X" da janela
 janela.protocol("WM_DELETE_WINDOW", on_closing)
 mudar_preset()
 posicionar_direita() # Chamada inicial para posicionar os botões corretamente
 periodic_save()
+verificar_eventos_pasta()
 janela.mainloop()
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Benchmarks dos caminhos mais usados (geração, miniaturas da galeria e leitura
+dos presets), sem interface gráfica.
+
+Gera presets sintéticos em uma pasta temporária, mede cada etapa com cada motor
+de composição disponível (Pillow e, se instalado, NumPy) e salva os resultados
+em JSON. O modo compare mostra a diferença entre dois arquivos de resultados.
+
+Exemplos:
+    python benchmark.py run --out antes.json
+    python benchmark.py run --resolutions 1080p 4k 8k --overlays 6 100 1000 --out depois.json
+    python benchmark.py compare antes.json depois.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import PIL
+from PIL import Image, ImageDraw
+
+import functions
+from functions import (
+    carregar_imagens,
+    carregar_g1_colorido,
+    gerar_miniatura_galeria,
+    miniatura_fundo,
+    processar_fundo,
+    gerar_imagem_final,
+    renderizar_lote,
+    codificar_imagem,
+    config_saida,
+    ContextoRender,
+    PASTA_CACHE_MINIATURAS,
+    INDICE_ARQUIVO,
+    numpy_disponivel
+)
+
+RESOLUCOES = {"1080p": (1920, 1080), "1440p": (2560, 1440), "4k": (3840, 2160), "8k": (7680, 4320)}
+MOTORES = ["pillow"] + (["numpy"] if numpy_disponivel() else [])
+SOBREPOSICOES_DISTINTAS = 6 # Imagens diferentes geradas; as demais são links/cópias delas
+VERSAO_RESULTADOS = 2 # 2: campo "black"
+
+# --- PRESETS SINTÉTICOS ---
+
+def _gradiente(tamanho, i):
+    """Imagem RGB com gradientes diferentes para cada 'i' (comprime como uma foto lisa, não como ruído)."""
+    largura, altura = tamanho
+    canais = []
+    for c in range(3):
+        g = Image.linear_gradient("L").rotate((i * 37 + c * 90) % 360).resize(tamanho)
+        canais.append(g.point(lambda v, c=c: (v * (c + 1) + i * 40) % 256))
+    return Image.merge("RGB", canais)
+
+def _sobreposicao(tamanho, i, alpha):
+    """Uma sobreposição: 'opaca' cobre a tela toda; 'esparsa' tem só alguns blocos (como texto) sobre transparência."""
+    if alpha == "opaca":
+        return _gradiente(tamanho, i + 10).convert("RGBA")
+    largura, altura = tamanho
+    img = Image.new("RGBA", tamanho, (0, 0, 0, 0))
+    desenho = ImageDraw.Draw(img)
+    linhas = 4 + i % 3
+    for linha in range(linhas):
+        y = altura // 3 + linha * altura // 14
+        desenho.rectangle((largura // 6, y, largura * (4 + linha % 2) // 6, y + altura // 25), fill=(255, 255, 255, 230))
+    return img
+
+def _camada_preta(tamanho, black):
+    """black.png: 'solida' é preto opaco (caminho rápido); 'gradiente' tem cor e alpha variando (mistura completa)."""
+    if black == "solida":
+        return Image.new("RGBA", tamanho, (0, 0, 0, 255))
+    camada = _gradiente(tamanho, 5).point(lambda v: v // 4).convert("RGBA")
+    camada.putalpha(Image.linear_gradient("L").rotate(90).resize(tamanho))
+    return camada
+
+def criar_preset_sintetico(base_dir, resolucao, quantidade, alpha, black="solida"):
+    """Cria a pasta de um preset sintético e retorna o seu preset_info."""
+    tamanho = RESOLUCOES[resolucao]
+    codigo = f"{resolucao}_{quantidade}_{alpha}_{black}"
+    pasta = os.path.join(base_dir, codigo)
+    os.makedirs(pasta, exist_ok=True)
+
+    _gradiente(tamanho, 0).save(os.path.join(pasta, "g1.png"))
+    _camada_preta(tamanho, black).save(os.path.join(pasta, "black.png"))
+    distintas = []
+    for i in range(min(quantidade, SOBREPOSICOES_DISTINTAS)):
+        caminho = os.path.join(pasta, f"sobreposicao{i:04d}.png")
+        _sobreposicao(tamanho, i, alpha).save(caminho)
+        distintas.append(caminho)
+    for i in range(len(distintas), quantidade):
+        destino = os.path.join(pasta, f"sobreposicao{i:04d}.png")
+        try:
+            os.link(distintas[i % len(distintas)], destino)
+        except OSError:
+            shutil.copy2(distintas[i % len(distintas)], destino)
+    return {"code": codigo, "color": "#3366CC", "mostrar_fundo": True, "opacidade": 40, "no_color": False}
+
+# --- MEDIÇÃO ---
+
+def _limpar_caches(base_dir):
+    """Volta ao estado de um programa recém-aberto (sem caches em memória nem em disco)."""
+    functions._indices.clear()
+    functions._cache_miniaturas.clear()
+    functions._cache_camada_solida.clear()
+    shutil.rmtree(os.path.join(base_dir, PASTA_CACHE_MINIATURAS), ignore_errors=True)
+
+def medir(funcao, repeticoes, preparar=None):
+    """Executa 'funcao' 'repeticoes' vezes (chamando 'preparar' antes de cada uma, fora do tempo)."""
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+def medir_preset(base_dir, preset_info, resolucao, quantidade, alpha, black, repeticoes, amostra):
+    """Mede todas as etapas em um preset sintético. Retorna a lista de resultados."""
+    codigo = preset_info["code"]
+    pasta = os.path.join(base_dir, codigo)
+    resultados = []
+
+    def registrar(etapa, tempos, itens, motor=None):
+        mediana = statistics.median(tempos)
+        resultados.append({
+            "etapa": etapa, "resolucao": resolucao, "sobreposicoes": quantidade, "alpha": alpha, "black": black, "motor": motor,
+            "itens": itens, "segundos": tempos, "mediana": mediana, "minimo": min(tempos),
+            "por_item": mediana / itens if itens else None,
+        })
+        print(f"  {etapa:<26}{motor or '':<8}{mediana * 1000:>10.1f} ms ({itens} itens)")
+
+    def indice_frio():
+        _limpar_caches(base_dir)
+        try:
+            os.remove(os.path.join(pasta, INDICE_ARQUIVO))
+        except FileNotFoundError:
+            pass
+
+    # Leitura do preset (escala com o número de arquivos)
+    registrar("carregar_imagens_frio", medir(lambda: carregar_imagens(codigo, base_dir), repeticoes, indice_frio), quantidade + 1)
+    registrar("carregar_imagens", medir(lambda: carregar_imagens(codigo, base_dir), repeticoes), quantidade + 1)
+
+    # Editor da g1 / miniatura do fundo
+    cor, opacidade = preset_info["color"], preset_info["opacidade"]
+    registrar("carregar_g1_colorido_frio", medir(lambda: carregar_g1_colorido(codigo, cor, opacidade, False, base_dir), repeticoes, lambda: _limpar_caches(base_dir)), 1)
+    registrar("carregar_g1_colorido", medir(lambda: carregar_g1_colorido(codigo, cor, opacidade, False, base_dir), repeticoes), 1)
+
+    # Miniaturas da galeria: o fundo uma vez por preset e uma miniatura por imagem, como na galeria
+    caminhos = [caminho for nome, caminho in carregar_imagens(codigo, base_dir) if nome != "g1.png"]
+    caminhos_amostra = caminhos[:amostra]
+
+    def miniaturas_galeria():
+        fundo = miniatura_fundo(preset_info, base_dir, (146, 96))
+        for caminho in caminhos_amostra:
+            gerar_miniatura_galeria(os.path.basename(caminho), caminho, fundo, base_dir)
+
+    registrar("miniaturas_galeria_frio", medir(miniaturas_galeria, repeticoes, lambda: _limpar_caches(base_dir)), len(caminhos_amostra))
+    registrar("miniaturas_galeria", medir(miniaturas_galeria, repeticoes), len(caminhos_amostra))
+
+    # Geração, lado a lado em cada motor
+    pasta_saida = os.path.join(base_dir, "output", codigo)
+    compostas = []
+    for motor in MOTORES:
+        registrar("processar_fundo", medir(lambda: processar_fundo(preset_info, base_dir, motor), repeticoes), 1, motor)
+        contexto = ContextoRender(preset_info, base_dir, motor)
+        contexto.fundo
+
+        def compor():
+            compostas[:] = [gerar_imagem_final(preset_info, caminho, base_dir, contexto) for caminho in caminhos_amostra]
+
+        registrar("gerar_imagem_final", medir(compor, repeticoes), len(caminhos_amostra), motor)
+
+        def lote():
+            list(renderizar_lote(preset_info, caminhos_amostra, pasta_saida, base_dir, contexto=ContextoRender(preset_info, base_dir, motor)))
+
+        def saida_limpa():
+            shutil.rmtree(pasta_saida, ignore_errors=True)
+            os.makedirs(pasta_saida)
+
+        registrar("renderizar_lote", medir(lote, repeticoes, saida_limpa), len(caminhos_amostra), motor)
+
+    # Codificação (independe do motor)
+    for perfil in ("padrao", "rapido"):
+        config = config_saida(saida=perfil)
+        registrar(f"codificar_{perfil}", medir(lambda: [codificar_imagem(img, config) for img in compostas], repeticoes), len(compostas))
+    return resultados
+
+def comando_run(args):
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_backgrounds_")
+    os.makedirs(base_dir, exist_ok=True)
+    resultados = []
+    try:
+        for resolucao in args.resolutions:
+            for quantidade in args.overlays:
+                for alpha in args.alpha:
+                    for black in args.black:
+                        print(f"{resolucao}, {quantidade} sobreposições, alpha {alpha}, black {black}:")
+                        preset_info = criar_preset_sintetico(base_dir, resolucao, quantidade, alpha, black)
+                        resultados += medir_preset(base_dir, preset_info, resolucao, quantidade, alpha, black, args.repeat, args.sample)
+                        shutil.rmtree(os.path.join(base_dir, preset_info["code"]), ignore_errors=True)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    dados = {
+        "versao": VERSAO_RESULTADOS,
+        "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "numpy": functions.np.__version__ if functions.np is not None else None,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": {"repeticoes": args.repeat, "amostra": args.sample},
+        "resultados": resultados,
+    }
+    with open(args.out, "w") as f:
+        json.dump(dados, f, indent=4)
+    print(f"Resultados salvos em '{args.out}'.")
+    return 0
+
+# --- COMPARAÇÃO ---
+
+def _chave(resultado):
+    # Resultados da versão 1 não têm "black": todos usavam preto sólido
+    return (resultado["etapa"], resultado["resolucao"], resultado["sobreposicoes"], resultado["alpha"], resultado.get("black", "solida"), resultado["motor"])
+
+def comando_compare(args):
+    with open(args.antes) as f:
+        antes = {_chave(r): r for r in json.load(f)["resultados"]}
+    with open(args.depois) as f:
+        depois = {_chave(r): r for r in json.load(f)["resultados"]}
+
+    print(f"{'etapa':<26}{'motor':<8}{'caso':<30}{'antes ms':>10}{'depois ms':>11}{'variação':>10}")
+    piorou = False
+    for chave in sorted(set(antes) & set(depois), key=lambda c: tuple(str(v) for v in c)):
+        a, d = antes[chave]["mediana"], depois[chave]["mediana"]
+        variacao = (d - a) / a if a else 0.0
+        marca = ""
+        if variacao > args.tolerance:
+            marca, piorou = "  PIOR", True
+        elif variacao < -args.tolerance:
+            marca = "  melhor"
+        etapa, resolucao, quantidade, alpha, black, motor = chave
+        caso = f"{resolucao}/{quantidade}/{alpha}/{black}"
+        print(f"{etapa:<26}{motor or '':<8}{caso:<30}{a * 1000:>10.1f}{d * 1000:>11.1f}{variacao:>+10.1%}{marca}")
+    for chave in sorted(set(antes) ^ set(depois), key=lambda c: tuple(str(v) for v in c)):
+        print(f"(só em {'antes' if chave in antes else 'depois'}) {chave}")
+    return 1 if piorou else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de geração, miniaturas e leitura de presets (sem interface gráfica).")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    run = subparsers.add_parser("run", help="cria presets sintéticos e mede cada etapa")
+    run.add_argument("--out", default="benchmark.json", help="arquivo JSON de resultados (padrão: benchmark.json)")
+    run.add_argument("--resolutions", nargs="+", choices=list(RESOLUCOES), default=["1080p", "4k"], help="resoluções (padrão: 1080p 4k)")
+    run.add_argument("--overlays", nargs="+", type=int, default=[6, 100], help="número de sobreposições por preset (padrão: 6 100)")
+    run.add_argument("--alpha", nargs="+", choices=["opaca", "esparsa"], default=["opaca", "esparsa"], help="tipo de sobreposição")
+    run.add_argument("--black", nargs="+", choices=["solida", "gradiente"], default=["solida", "gradiente"],
+                     help="black.png: preto sólido ou com gradiente de cor/alpha (mistura completa)")
+    run.add_argument("--repeat", type=int, default=3, help="repetições de cada medição (padrão: 3)")
+    run.add_argument("--sample", type=int, default=6, help="sobreposições usadas nas etapas de composição e miniatura (padrão: 6)")
+    run.add_argument("--work-dir", default=None, help="pasta para os presets sintéticos (padrão: uma pasta temporária apagada no fim)")
+    run.set_defaults(func=comando_run)
+
+    compare = subparsers.add_parser("compare", help="compara dois arquivos de resultados")
+    compare.add_argument("antes")
+    compare.add_argument("depois")
+    compare.add_argument("--tolerance", type=float, default=0.10, help="variação considerada ruído (padrão: 0.10 = 10%%)")
+    compare.set_defaults(func=comando_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Gerador de backgrounds por linha de comando, sem interface gráfica.
+
+Não importa tkinter nem ImageTk, então pode rodar em servidores sem display.
+
+Exemplos:
+    python cli.py render --preset standard
+    python cli.py render --all --out output --jobs 4
+    python cli.py render --preset standard --profile rapido
+    python cli.py render --preset standard --sizes 1920x1080 1280x720 320x180
+    python cli.py render --preset standard --timings --trace trace.json
+    python cli.py bench-encode --preset standard
+"""
+import os
+import sys
+import argparse
+from functions import (
+    carregar_presets,
+    carregar_imagens,
+    renderizar_lote,
+    renderizar_todos,
+    ContextoRender,
+    PERFIS_SAIDA,
+    MOTORES,
+    config_saida,
+    iniciar_cronometro,
+    parar_cronometro,
+    medir_codificadores
+)
+
+DEFAULT_PRESET = "standard"
+DEFAULT_PRESET_DATA = {DEFAULT_PRESET: {"code": "standard", "color": "#FFFFFF", "mostrar_fundo": False}}
+
+def saida_da_execucao(args):
+    """Configuração de saída pedida na linha de comando (None = a do preset)."""
+    saida = dict(PERFIS_SAIDA[args.profile]) if args.profile else {}
+    if args.format:
+        saida["formato"] = args.format
+    if args.png_level is not None:
+        saida["compress_level"] = args.png_level
+    if args.optimize:
+        saida["optimize"] = True
+    if args.quality is not None:
+        saida["quality"] = args.quality
+    if args.webp_lossy:
+        saida["lossless"] = False
+    if args.sizes:
+        saida["tamanhos"] = args.sizes
+    return saida or None
+
+def tamanho(texto):
+    """Converte 'LARGURAxALTURA' (ex.: 1280x720) em [largura, altura]."""
+    try:
+        largura, altura = (int(v) for v in texto.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: '{texto}' (use LARGURAxALTURA, ex.: 1280x720)")
+    if largura <= 0 or altura <= 0:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: '{texto}'")
+    return [largura, altura]
+
+def qualidade(texto):
+    """Converte a qualidade do JPEG/WebP, que deve estar entre 1 e 100."""
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"qualidade inválida: '{texto}'")
+    if not 1 <= valor <= 100:
+        raise argparse.ArgumentTypeError(f"qualidade inválida: {valor} (use de 1 a 100)")
+    return valor
+
+def nova_contagem():
+    return {"gerada": 0, "inalterada": 0, "pulada": 0, "erro": 0}
+
+def resumo(contagem):
+    """Resumo de um preset: só as "gerada" foram gravadas; "inalterada" e "pulada" já estavam em dia."""
+    total = sum(contagem.values())
+    return (f"{contagem['gerada']}/{total} imagens gravadas, {contagem['pulada'] + contagem['inalterada']} já atualizadas"
+            + (f", {contagem['erro']} com erro" if contagem["erro"] else ""))
+
+def renderizar_preset(nome, preset_info, base_dir, pasta_output, jobs, saida=None, motor=None):
+    """Gera todas as imagens de um preset em pasta_output. Retorna a contagem por situação."""
+    os.makedirs(pasta_output, exist_ok=True)
+    caminhos = [caminho for _, caminho in carregar_imagens(preset_info["code"], base_dir)]
+    total = len(caminhos)
+    contagem = nova_contagem()
+
+    try:
+        contexto = ContextoRender(preset_info, base_dir, motor)
+        contexto.fundo # Carrega o fundo aqui, para um g1/black inválido virar um único erro
+    except Exception as e:
+        print(f"ERRO ao preparar o fundo do preset '{nome}': {e}", file=sys.stderr)
+        contagem["erro"] = total
+        return contagem
+
+    for i, (nome_imagem, situacao, erro) in enumerate(renderizar_lote(preset_info, caminhos, pasta_output, base_dir, jobs, contexto, saida)):
+        contagem[situacao] += 1
+        if situacao == "erro":
+            print(f"[{nome}] ERRO em '{nome_imagem}': {erro}", file=sys.stderr)
+        else:
+            print(f"[{nome}] {i+1}/{total}: {nome_imagem} ({situacao})")
+    return contagem
+
+def renderizar_todos_os_presets(presets, base_dir, pasta_output, jobs, saida=None, motor=None):
+    """Gera todos os presets, um por subpasta com o seu código, decodificando cada sobreposição uma vez."""
+    try:
+        for nome in presets:
+            config_saida(presets[nome], saida) # Valida antes de começar
+    except ValueError as e:
+        print(f"ERRO na configuração de saída do preset '{nome}': {e}", file=sys.stderr)
+        return 1
+
+    contagens = {nome: nova_contagem() for nome in presets}
+    estatisticas = {}
+    for nome, nome_imagem, situacao, erro in renderizar_todos(presets, base_dir, pasta_output, jobs, saida, estatisticas, motor):
+        contagens[nome][situacao] += 1
+        if situacao == "erro":
+            print(f"[{nome}] ERRO em '{nome_imagem}': {erro}", file=sys.stderr)
+        else:
+            print(f"[{nome}] {nome_imagem} ({situacao})")
+
+    for nome, contagem in contagens.items():
+        print(f"Preset '{nome}': {resumo(contagem)} em '{os.path.join(pasta_output, presets[nome]['code'])}'.")
+    print(f"{estatisticas['decodificadas']} sobreposições decodificadas para {estatisticas['imagens']} imagens compostas.")
+    return 1 if any(contagem["erro"] for contagem in contagens.values()) else 0
+
+def comando_render(args):
+    base_dir = os.path.abspath(args.base_dir)
+    data_file = args.presets_file or os.path.join(base_dir, "presets.json")
+    presets = carregar_presets(data_file, DEFAULT_PRESET_DATA, DEFAULT_PRESET)
+    pasta_output = os.path.abspath(args.out)
+    saida = saida_da_execucao(args)
+
+    if args.timings or args.trace:
+        iniciar_cronometro()
+    try:
+        return _executar_render(args, presets, base_dir, pasta_output, saida)
+    finally:
+        cronometro = parar_cronometro()
+        if cronometro is not None:
+            if args.timings:
+                print("Tempo por etapa:")
+                for linha in cronometro.linhas_resumo():
+                    print(f"  {linha}")
+            if args.trace:
+                cronometro.exportar_trace(args.trace)
+                print(f"Trace salvo em '{args.trace}' (abra em chrome://tracing ou ui.perfetto.dev).")
+
+def _executar_render(args, presets, base_dir, pasta_output, saida):
+    if args.all:
+        return renderizar_todos_os_presets(presets, base_dir, pasta_output, args.jobs, saida, args.engine)
+
+    if args.preset not in presets:
+        print(f"Preset '{args.preset}' não encontrado. Disponíveis: {', '.join(presets)}", file=sys.stderr)
+        return 2
+    alvos = [(args.preset, presets[args.preset], pasta_output)]
+
+    falhas = 0
+    for nome, info, destino in alvos:
+        try:
+            contagem = renderizar_preset(nome, info, base_dir, destino, args.jobs, saida, args.engine)
+        except ValueError as e:
+            print(f"ERRO na configuração de saída do preset '{nome}': {e}", file=sys.stderr)
+            falhas += 1
+            continue
+        print(f"Preset '{nome}': {resumo(contagem)} em '{destino}'.")
+        falhas += contagem["erro"]
+    return 1 if falhas else 0
+
+def comando_bench_encode(args):
+    base_dir = os.path.abspath(args.base_dir)
+    data_file = args.presets_file or os.path.join(base_dir, "presets.json")
+    presets = carregar_presets(data_file, DEFAULT_PRESET_DATA, DEFAULT_PRESET)
+    if args.preset not in presets:
+        print(f"Preset '{args.preset}' não encontrado. Disponíveis: {', '.join(presets)}", file=sys.stderr)
+        return 2
+
+    resultados = medir_codificadores(presets[args.preset], base_dir, args.profiles, args.limit)
+    print(f"{'perfil':<18}{'imagens':>8}{'ms/imagem':>12}{'KB/imagem':>12}")
+    for r in resultados:
+        if r["erro"]:
+            print(f"{r['perfil']:<18}{'':>8}  {r['erro']}")
+            continue
+        n = max(r["imagens"], 1)
+        print(f"{r['perfil']:<18}{r['imagens']:>8}{r['segundos'] * 1000 / n:>12.1f}{r['bytes'] / 1024 / n:>12.1f}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os backgrounds dos presets sem abrir a interface gráfica.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    render = subparsers.add_parser("render", help="gera as imagens de um ou de todos os presets")
+    grupo = render.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--preset", help="nome do preset a gerar")
+    grupo.add_argument("--all", action="store_true", help="gera todos os presets, um por subpasta")
+    render.add_argument("--out", default="output", help="pasta de saída (padrão: output)")
+    render.add_argument("--jobs", type=int, default=None, help="número de threads (padrão: uma por CPU)")
+    render.add_argument("--base-dir", default=os.getcwd(), help="pasta com os presets (padrão: diretório atual)")
+    render.add_argument("--presets-file", default=None, help="arquivo de presets (padrão: <base-dir>/presets.json)")
+    render.add_argument("--profile", choices=list(PERFIS_SAIDA), default=None, help="perfil de saída (padrão: o do preset)")
+    render.add_argument("--format", choices=["png", "webp", "jpeg"], default=None, help="formato de saída")
+    render.add_argument("--png-level", type=int, choices=range(10), default=None, metavar="0-9", help="nível de compressão do PNG")
+    render.add_argument("--optimize", action="store_true", help="PNG: procura os melhores filtros (mais lento)")
+    render.add_argument("--quality", type=qualidade, default=None, metavar="1-100", help="qualidade do JPEG/WebP com perdas")
+    render.add_argument("--webp-lossy", action="store_true", help="WebP com perdas")
+    render.add_argument("--sizes", nargs="+", type=tamanho, default=None, metavar="LxA",
+                        help="gera também estas resoluções (ex.: 1920x1080 1280x720), com o tamanho no nome do arquivo")
+    render.add_argument("--engine", choices=list(MOTORES), default=None,
+                        help="motor de composição (padrão: pillow; numpy exige o NumPy instalado)")
+    render.add_argument("--timings", action="store_true", help="mostra o tempo de cada etapa (decodificação, colorização, ...)")
+    render.add_argument("--trace", default=None, metavar="ARQUIVO", help="salva os tempos de cada etapa como trace do Chrome (JSON)")
+    render.set_defaults(func=comando_render)
+
+    bench = subparsers.add_parser("bench-encode", help="compara o tempo e o tamanho de cada perfil de saída nas imagens de um preset")
+    bench.add_argument("--preset", required=True, help="nome do preset")
+    bench.add_argument("--profiles", nargs="+", choices=list(PERFIS_SAIDA), default=None, help="perfis a comparar (padrão: todos)")
+    bench.add_argument("--limit", type=int, default=None, help="usa só as N primeiras imagens")
+    bench.add_argument("--base-dir", default=os.getcwd(), help="pasta com os presets (padrão: diretório atual)")
+    bench.add_argument("--presets-file", default=None, help="arquivo de presets (padrão: <base-dir>/presets.json)")
+    bench.set_defaults(func=comando_bench_encode)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
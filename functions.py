@@ -1,37 +1,536 @@
 import os
+import io
+import re
 import json
+import queue
+import shutil
 import random
 import string
-from PIL import Image, ImageOps
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageColor, PngImagePlugin
+
+# NumPy é opcional e só é importado quando o motor "numpy" é usado (veja _importar_numpy)
+np = None
+
+def numpy_disponivel():
+    """Diz se o NumPy está instalado, sem importá-lo."""
+    return np is not None or importlib.util.find_spec("numpy") is not None
+
+def _importar_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+# --- CRONOMETRAGEM DAS ETAPAS ---
+# Cronometro ativo; sem ele, medir_etapa() não registra nada
+_cronometro = None
+
+class Cronometro:
+    """
+    Registra a duração de cada etapa da geração (leitura, decodificação,
+    colorização, mistura, redimensionamento, colagem, codificação e gravação),
+    de todas as threads. Gera o resumo por etapa e exporta os eventos no
+    formato de trace do Chrome (chrome://tracing, Perfetto).
+
+    O MB/s das etapas de imagem é calculado sobre os pixels descomprimidos;
+    o da leitura e o da gravação, sobre os bytes do arquivo.
+    """
+    def __init__(self):
+        self.eventos = [] # (etapa, inicio, duracao, id_thread, nome_thread, bytes, detalhe)
+        self._lock = threading.Lock()
+        self._origem = time.perf_counter()
+        self.duracao_total = None
+
+    def registrar(self, nome, inicio, fim, bytes_processados=0, detalhe=None):
+        thread = threading.current_thread()
+        with self._lock:
+            self.eventos.append((nome, inicio - self._origem, fim - inicio, thread.ident, thread.name, bytes_processados, detalhe))
+
+    def encerrar(self):
+        self.duracao_total = time.perf_counter() - self._origem
+
+    def resumo(self):
+        """{etapa: {n, total, p50, p95, bytes, mb_s}}, com os tempos em segundos."""
+        por_etapa = {}
+        for nome, _, duracao, _, _, bytes_processados, _ in self.eventos:
+            etapa = por_etapa.setdefault(nome, {"duracoes": [], "bytes": 0})
+            etapa["duracoes"].append(duracao)
+            etapa["bytes"] += bytes_processados
+        resumo = {}
+        for nome, etapa in por_etapa.items():
+            duracoes = sorted(etapa["duracoes"])
+            total = sum(duracoes)
+            resumo[nome] = {
+                "n": len(duracoes),
+                "total": total,
+                "p50": duracoes[(len(duracoes) - 1) // 2],
+                "p95": duracoes[max(0, -(-len(duracoes) * 95 // 100) - 1)],
+                "bytes": etapa["bytes"],
+                "mb_s": etapa["bytes"] / total / 1e6 if total else 0.0,
+            }
+        return resumo
+
+    def linhas_resumo(self):
+        """O resumo em texto, uma linha por etapa (da mais demorada para a menos)."""
+        linhas = []
+        if self.duracao_total is not None:
+            linhas.append(f"Tempo total: {self.duracao_total:.2f} s (as etapas abaixo somam o tempo de todas as threads)")
+        for nome, r in sorted(self.resumo().items(), key=lambda item: -item[1]["total"]):
+            linhas.append(f"{nome}: {r['n']}x, total {r['total']:.2f} s, p50 {r['p50'] * 1000:.1f} ms, "
+                          f"p95 {r['p95'] * 1000:.1f} ms, {r['mb_s']:.1f} MB/s")
+        return linhas
+
+    def exportar_trace(self, caminho):
+        """Salva os eventos como trace do Chrome (um evento "X" por etapa, uma linha por thread)."""
+        pid = os.getpid()
+        eventos = []
+        threads = {}
+        for nome, inicio, duracao, id_thread, nome_thread, bytes_processados, detalhe in self.eventos:
+            threads[id_thread] = nome_thread
+            args = {"bytes": bytes_processados}
+            if detalhe:
+                args["arquivo"] = detalhe
+            eventos.append({"name": nome, "cat": "render", "ph": "X", "ts": inicio * 1e6, "dur": duracao * 1e6,
+                            "pid": pid, "tid": id_thread, "args": args})
+        for id_thread, nome_thread in threads.items():
+            eventos.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": id_thread, "args": {"name": nome_thread}})
+        with open(caminho, "w") as f:
+            json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f)
+
+def iniciar_cronometro():
+    """Ativa a cronometragem das etapas (para todas as threads) e retorna o Cronometro."""
+    global _cronometro
+    _cronometro = Cronometro()
+    return _cronometro
+
+def parar_cronometro():
+    """Desativa a cronometragem e retorna o Cronometro que estava ativo (ou None)."""
+    global _cronometro
+    cronometro, _cronometro = _cronometro, None
+    if cronometro is not None:
+        cronometro.encerrar()
+    return cronometro
+
+class _Etapa:
+    __slots__ = ("nome", "detalhe", "bytes", "_inicio")
+
+    def __init__(self, nome, detalhe):
+        self.nome = nome
+        self.detalhe = detalhe
+        self.bytes = 0
+        self._inicio = None
+
+    def __enter__(self):
+        if _cronometro is not None:
+            self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        cronometro = _cronometro
+        if cronometro is not None and self._inicio is not None:
+            cronometro.registrar(self.nome, self._inicio, time.perf_counter(), self.bytes, self.detalhe)
+
+def medir_etapa(nome, detalhe=None):
+    """
+    Mede o bloco 'with' como a etapa 'nome' se houver um cronômetro ativo.
+    Quem mede pode preencher .bytes (pixels ou bytes do arquivo) para o MB/s.
+    """
+    return _Etapa(nome, detalhe)
+
+def _bytes_imagem(imagem):
+    return imagem.width * imagem.height * len(imagem.getbands())
 
 def gerar_codigo():
     """Gera um código aleatório de 6 dígitos."""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+def _completar_preset(preset):
+    """Garante compatibilidade retroativa: adiciona as chaves que presets antigos não têm."""
+    preset.setdefault("mostrar_fundo", False)
+    preset.setdefault("opacidade", 0)
+    preset.setdefault("no_color", False)
+    preset.setdefault("saida", PERFIL_SAIDA_PADRAO)
+    return preset
+
 def carregar_presets(data_file, default_preset_data, DEFAULT_PRESET):
-    """Carrega os presets de um arquivo JSON."""
+    """Carrega os presets de um arquivo JSON (ou de um banco SQLite, se terminar em .db/.sqlite)."""
+    if data_file.lower().endswith(EXTENSOES_SQLITE):
+        # sqlite3.connect criaria um banco vazio em um caminho errado, sem avisar
+        if not os.path.exists(data_file):
+            print(f"Aviso: o banco de presets '{data_file}' não existe; usando o preset padrão.")
+            _completar_preset(default_preset_data[DEFAULT_PRESET])
+            return default_preset_data
+        armazem = ArmazemPresets(data_file)
+        try:
+            return armazem.carregar(default_preset_data, DEFAULT_PRESET)
+        finally:
+            armazem.fechar()
+
     if os.path.exists(data_file):
         with open(data_file, "r") as f:
             data = json.load(f)
-        # Garante compatibilidade retroativa
         for preset in data.values():
-            if "mostrar_fundo" not in preset:
-                preset["mostrar_fundo"] = False
-            if "opacidade" not in preset:
-                preset["opacidade"] = 0
-            if "no_color" not in preset:
-                preset["no_color"] = False
+            _completar_preset(preset)
         return data
     
     # Adiciona as chaves também ao preset padrão inicial
-    default_preset_data[DEFAULT_PRESET]["opacidade"] = 0
-    default_preset_data[DEFAULT_PRESET]["no_color"] = False
+    _completar_preset(default_preset_data[DEFAULT_PRESET])
     return default_preset_data
 
 def salvar_presets(presets_data, data_file):
-    """Salva os presets em um arquivo JSON."""
-    with open(data_file, "w") as f:
-        json.dump(presets_data, f, indent=4)
+    """Salva os presets em um arquivo JSON, de forma atômica (um erro no meio nunca deixa o arquivo truncado)."""
+    gravar_atomico(data_file, json.dumps(presets_data, indent=4).encode("utf-8"), sincronizar=True)
+
+# --- ARMAZENAMENTO DOS PRESETS ---
+ATRASO_SALVAR_PRESETS = 0.5 # segundos juntando alterações antes de gravar
+EXTENSOES_SQLITE = (".db", ".sqlite", ".sqlite3")
+
+class ArmazemPresets:
+    """
+    Grava os presets em segundo plano, juntando as alterações feitas em um
+    intervalo de 'atraso' segundos em uma única gravação.
+
+    Quem altera o dicionário de presets chama marcar(presets, nome); a entrada
+    é copiada na hora, então o dicionário pode continuar sendo alterado enquanto
+    a gravação acontece. Com um caminho .json, o arquivo inteiro é regravado de
+    forma atômica (temporário + fsync + os.replace). Com .db/.sqlite, cada preset
+    é uma linha de um banco SQLite e só as linhas alteradas são gravadas.
+    fechar() grava o que estiver pendente. Depois de carregar(), 'origem' diz
+    de onde vieram os presets: "arquivo", "importados" ou "padrao".
+    """
+    def __init__(self, caminho, atraso=ATRASO_SALVAR_PRESETS):
+        self.caminho = caminho
+        self.atraso = atraso
+        self.sqlite = caminho.lower().endswith(EXTENSOES_SQLITE)
+        self._dados = {} # Cópia do que está (ou estará) no disco; usada pelo backend JSON
+        self._pendentes = {} # nome -> cópia do preset, ou None se foi excluído
+        self._lock = threading.Lock()
+        self._lock_escrita = threading.Lock()
+        self._timer = None
+        self._conexao = None
+        self.origem = None
+        if self.sqlite:
+            import sqlite3
+            if not os.path.exists(caminho):
+                print(f"Aviso: o banco de presets '{caminho}' não existe e será criado.")
+            self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("CREATE TABLE IF NOT EXISTS presets (nome TEXT PRIMARY KEY, dados TEXT NOT NULL)")
+            self._conexao.commit()
+
+    def carregar(self, default_preset_data, DEFAULT_PRESET, importar_de=None):
+        """
+        Carrega todos os presets. Um banco SQLite vazio é preenchido com os presets
+        do arquivo JSON 'importar_de', se ele existir.
+        """
+        self.origem = "arquivo"
+        if not self.sqlite:
+            if not os.path.exists(self.caminho):
+                self.origem = "padrao"
+            presets = carregar_presets(self.caminho, default_preset_data, DEFAULT_PRESET)
+        else:
+            with self._lock_escrita:
+                linhas = self._conexao.execute("SELECT nome, dados FROM presets ORDER BY rowid").fetchall()
+            presets = {nome: _completar_preset(json.loads(dados)) for nome, dados in linhas}
+            if not presets:
+                if importar_de and os.path.exists(importar_de):
+                    print(f"Banco de presets '{self.caminho}' vazio: importando os presets de '{importar_de}'.")
+                    self.origem = "importados"
+                    presets = carregar_presets(importar_de, default_preset_data, DEFAULT_PRESET)
+                    self.marcar(presets)
+                else:
+                    print(f"Aviso: banco de presets '{self.caminho}' vazio e nada para importar; usando o preset padrão.")
+                    self.origem = "padrao"
+                    _completar_preset(default_preset_data[DEFAULT_PRESET])
+                    presets = default_preset_data
+        self._dados = {nome: dict(info) for nome, info in presets.items()}
+        return presets
+
+    def ler(self, nome):
+        """Lê um preset do armazenamento (no SQLite, só a linha dele). Retorna None se não existir."""
+        self.salvar()
+        if not self.sqlite:
+            info = self._dados.get(nome)
+            return dict(info) if info is not None else None
+        with self._lock_escrita:
+            linha = self._conexao.execute("SELECT dados FROM presets WHERE nome = ?", (nome,)).fetchone()
+        return _completar_preset(json.loads(linha[0])) if linha else None
+
+    def marcar(self, presets, nome=None):
+        """
+        Registra a alteração do preset 'nome' (ou de todos, com nome=None; presets
+        que saíram do dicionário são excluídos) e agenda a gravação.
+        """
+        with self._lock:
+            nomes = [nome] if nome is not None else set(presets) | set(self._dados) | set(self._pendentes)
+            for n in nomes:
+                self._pendentes[n] = dict(presets[n]) if n in presets else None
+            if self._timer is None:
+                self._timer = threading.Timer(self.atraso, self.salvar)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def salvar(self):
+        """Grava agora as alterações pendentes."""
+        with self._lock_escrita:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pendentes, self._pendentes = self._pendentes, {}
+            if not pendentes:
+                return
+            try:
+                if self.sqlite:
+                    self._gravar_linhas(pendentes)
+                else:
+                    dados = dict(self._dados)
+                    for nome, info in pendentes.items():
+                        if info is None:
+                            dados.pop(nome, None)
+                        else:
+                            dados[nome] = info
+                    salvar_presets(dados, self.caminho)
+                    self._dados = dados
+            except Exception as e:
+                # Devolve as alterações (sem sobrescrever as mais novas) para a próxima tentativa
+                with self._lock:
+                    for nome, info in pendentes.items():
+                        self._pendentes.setdefault(nome, info)
+                print(f"Erro ao salvar os presets em '{self.caminho}': {e}")
+
+    def _gravar_linhas(self, pendentes):
+        with self._conexao:
+            for nome, info in pendentes.items():
+                if info is None:
+                    self._conexao.execute("DELETE FROM presets WHERE nome = ?", (nome,))
+                else:
+                    self._conexao.execute(
+                        "INSERT INTO presets (nome, dados) VALUES (?, ?) ON CONFLICT(nome) DO UPDATE SET dados = excluded.dados",
+                        (nome, json.dumps(info)))
+        for nome, info in pendentes.items():
+            if info is None:
+                self._dados.pop(nome, None)
+            else:
+                self._dados[nome] = info
+
+    def fechar(self):
+        """Grava o que estiver pendente e fecha o banco."""
+        self.salvar()
+        if self._conexao is not None:
+            self._conexao.close()
+            self._conexao = None
+
+# --- LOJA DE ARQUIVOS ---
+# As imagens dos presets são hardlinks para arquivos da loja, nomeados pelo hash
+# do conteúdo: criar um preset não copia nada, e imagens iguais ocupam o disco uma
+# vez só. O número de links de cada arquivo (st_nlink) é a contagem de referências.
+# Em sistemas de arquivos sem hardlinks, as imagens são copiadas como antes.
+PASTA_LOJA = ".store"
+
+def _caminho_blob(base_dir, hash_conteudo):
+    return os.path.join(base_dir, PASTA_LOJA, hash_conteudo[:2], hash_conteudo)
+
+def _hash_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _substituir_por_link(origem, caminho):
+    """Troca 'caminho' por um hardlink para 'origem', sem passar por um momento em que ele não existe."""
+    pasta, nome = os.path.split(caminho)
+    temporario = os.path.join(pasta, f".{nome}.{gerar_codigo()}.tmp")
+    os.link(origem, temporario)
+    try:
+        os.replace(temporario, caminho)
+    except OSError:
+        os.remove(temporario)
+        raise
+
+def guardar_na_loja(caminho, base_dir):
+    """
+    Registra o arquivo 'caminho' na loja: se já existir um arquivo com o mesmo
+    conteúdo, 'caminho' passa a ser um link para ele; se não, o próprio arquivo
+    vira o da loja. Retorna o hash do conteúdo.
+    """
+    hash_conteudo = _hash_arquivo(caminho)
+    blob = _caminho_blob(base_dir, hash_conteudo)
+    try:
+        if os.path.exists(blob):
+            if not os.path.samefile(blob, caminho):
+                _substituir_por_link(blob, caminho)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.link(caminho, blob)
+    except OSError as e:
+        print(f"Aviso: '{os.path.basename(caminho)}' não foi deduplicado na loja: {e}")
+    return hash_conteudo
+
+def vincular_da_loja(origem, destino, base_dir):
+    """
+    Coloca em 'destino' o conteúdo de 'origem' como link da loja (ou cópia, se
+    não houver hardlinks). 'origem' em si não vira link: a loja recebe uma cópia
+    dele, então editar o original (ex.: em raws/) não altera os presets.
+    """
+    blob = _caminho_blob(base_dir, _hash_arquivo(origem))
+    try:
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            temporario = f"{blob}.{gerar_codigo()}.tmp"
+            shutil.copy2(origem, temporario)
+            os.replace(temporario, blob)
+        if os.path.exists(destino):
+            _substituir_por_link(blob, destino)
+        else:
+            os.link(blob, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+def salvar_imagem_no_preset(imagem, caminho, base_dir, formato="PNG"):
+    """
+    Salva 'imagem' em uma pasta de preset. O arquivo antigo pode ser um link
+    compartilhado com outros presets, então ele nunca é sobrescrito no lugar:
+    o novo conteúdo vai para um arquivo novo (gravar_atomico) que substitui o
+    link (cópia na escrita) e depois é registrado na loja.
+    """
+    buffer = io.BytesIO()
+    imagem.save(buffer, formato)
+    gravar_atomico(caminho, buffer.getvalue())
+    guardar_na_loja(caminho, base_dir)
+
+def limpar_loja(base_dir):
+    """
+    Apaga da loja os arquivos que nenhum preset usa mais (só o link da própria
+    loja). Retorna (arquivos_apagados, bytes_liberados).
+    """
+    pasta_loja = os.path.join(base_dir, PASTA_LOJA)
+    apagados, liberados = 0, 0
+    if not os.path.isdir(pasta_loja):
+        return apagados, liberados
+    for prefixo in os.scandir(pasta_loja):
+        if not prefixo.is_dir():
+            continue
+        for blob in os.scandir(prefixo.path):
+            # os.stat, não blob.stat(): no Windows o DirEntry sempre informa st_nlink == 0
+            info = os.stat(blob.path)
+            if info.st_nlink <= 1:
+                try:
+                    os.remove(blob.path)
+                    apagados += 1
+                    liberados += info.st_size
+                except OSError as e:
+                    print(f"Erro ao apagar '{blob.name}' da loja: {e}")
+        try:
+            os.rmdir(prefixo.path) # Só funciona se a subpasta tiver ficado vazia
+        except OSError:
+            pass
+    return apagados, liberados
+
+# Arquivo (dentro de cada pasta de preset) com o índice das imagens da pasta
+INDICE_ARQUIVO = ".index.json"
+EXTENSOES_IMAGEM = (".png", ".jpg", ".jpeg")
+
+# Índices já carregados, por pasta, para não reler o JSON a cada consulta
+_indices = {}
+_lock_indices = threading.Lock()
+
+def _entrada_parcial(info):
+    """Entrada do índice só com o que o stat já diz; hash e caixa ficam para quando forem pedidos."""
+    return {
+        "tamanho_arquivo": info.st_size,
+        "mtime_ns": info.st_mtime_ns,
+        "hash": None,
+        "largura": None,
+        "altura": None,
+        "modo": None,
+        "caixa_alpha": None,
+    }
+
+def _entrada_indice(caminho, info):
+    """Lê um arquivo de imagem e monta a sua entrada no índice."""
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    entrada = _entrada_parcial(info)
+    entrada["hash"] = hashlib.sha256(dados).hexdigest()
+    try:
+        img = Image.open(io.BytesIO(dados))
+        entrada["largura"], entrada["altura"] = img.size
+        entrada["modo"] = img.mode
+        # Região onde a imagem não é transparente (a imagem toda se ela não tiver alpha)
+        if "A" in img.getbands() or "transparency" in img.info:
+            caixa = img.convert("RGBA").getchannel("A").getbbox()
+        else:
+            caixa = (0, 0, img.width, img.height)
+        entrada["caixa_alpha"] = list(caixa) if caixa else None
+    except (OSError, ValueError) as e:
+        print(f"Erro ao indexar '{os.path.basename(caminho)}': {e}")
+    return entrada
+
+def carregar_indice(pasta, completo=True):
+    """
+    Retorna o índice das imagens de uma pasta de preset: {nome: entrada}, com
+    tamanho do arquivo, mtime, hash do conteúdo, dimensões, modo e a caixa onde
+    o alpha não é zero. O índice fica salvo em INDICE_ARQUIVO e é atualizado de
+    forma incremental: a pasta é listada com os.scandir e só os arquivos cujo
+    tamanho ou mtime mudou são lidos de novo. Retorna {} se a pasta não existir.
+
+    Com completo=False (para quem só precisa dos nomes, como a galeria), nenhum
+    arquivo é lido: as entradas novas ou alteradas ficam com hash None e são
+    completadas na próxima chamada com completo=True.
+    """
+    # O lock só protege _indices; ler e hashear as imagens novas (o que pode
+    # demorar) acontece fora dele, sem travar consultas a outras pastas
+    with _lock_indices:
+        indice = _indices.get(pasta)
+    if indice is None:
+        try:
+            with open(os.path.join(pasta, INDICE_ARQUIVO), "r") as f:
+                indice = json.load(f)
+        except (OSError, ValueError):
+            indice = {}
+
+    novo = {}
+    mudou = False
+    try:
+        entradas = os.scandir(pasta)
+    except (FileNotFoundError, NotADirectoryError):
+        with _lock_indices:
+            _indices.pop(pasta, None)
+        return {}
+    with entradas:
+        for arquivo in entradas:
+            if not arquivo.name.lower().endswith(EXTENSOES_IMAGEM) or not arquivo.is_file():
+                continue
+            info = arquivo.stat()
+            antiga = indice.get(arquivo.name)
+            atual = antiga and antiga["tamanho_arquivo"] == info.st_size and antiga["mtime_ns"] == info.st_mtime_ns
+            if atual and (antiga["hash"] is not None or not completo):
+                novo[arquivo.name] = antiga
+            elif completo:
+                novo[arquivo.name] = _entrada_indice(arquivo.path, info)
+                mudou = True
+            else:
+                novo[arquivo.name] = _entrada_parcial(info)
+                mudou = True
+
+    if mudou or novo.keys() != indice.keys():
+        try:
+            gravar_atomico(os.path.join(pasta, INDICE_ARQUIVO), json.dumps(novo, indent=4, sort_keys=True).encode("utf-8"))
+        except OSError as e:
+            print(f"Erro ao salvar o índice de '{pasta}': {e}")
+    with _lock_indices:
+        _indices[pasta] = novo
+    return dict(novo)
 
 def carregar_imagens(preset_code, base_dir):
     """
@@ -39,57 +538,260 @@ def carregar_imagens(preset_code, base_dir):
     e que black.png seja ignorado.
     """
     pasta = os.path.join(base_dir, preset_code)
-    if not os.path.exists(pasta):
-        return []
+    indice = carregar_indice(pasta, completo=False) # Só os nomes: nenhum arquivo é lido
     
     imagens = []
     
     # Adiciona g1.png primeiro, se existir
-    caminho_g1 = os.path.join(pasta, "g1.png")
-    if os.path.exists(caminho_g1):
-        imagens.append(("g1.png", caminho_g1))
+    if "g1.png" in indice:
+        imagens.append(("g1.png", os.path.join(pasta, "g1.png")))
     
     # Adiciona as outras imagens, ignorando g1.png e black.png
-    for arquivo in sorted(os.listdir(pasta)):
-        # --- CONDIÇÃO ADICIONADA AQUI ---
+    for arquivo in sorted(indice):
         # Converte para minúsculas para a checagem não falhar
         nome_arquivo_lower = arquivo.lower()
         if nome_arquivo_lower == "g1.png" or nome_arquivo_lower == "black.png":
             continue
-        
-        if nome_arquivo_lower.endswith((".png", ".jpg", ".jpeg")):
-            caminho = os.path.join(pasta, arquivo)
-            imagens.append((arquivo, caminho))
+        imagens.append((arquivo, os.path.join(pasta, arquivo)))
             
     return imagens
 
+def carregar_reduzida(caminho, tamanho_alvo, reducing_gap=2.0):
+    """
+    Abre uma imagem já decodificada perto de 'tamanho_alvo', para ser redimensionada
+    depois com qualidade. JPEG é decodificado direto em escala reduzida (draft);
+    os outros formatos são reduzidos por um fator inteiro (reduce), mantendo pelo
+    menos 'reducing_gap' vezes o tamanho alvo.
+    """
+    img = Image.open(caminho)
+    largura, altura = tamanho_alvo
+    if img.format == "JPEG":
+        img.draft("RGB", (int(largura * reducing_gap), int(altura * reducing_gap)))
+        return img
+
+    fator = int(min(img.width / (largura * reducing_gap), img.height / (altura * reducing_gap)))
+    if fator < 2:
+        return img
+    if img.mode in ("P", "PA"):
+        img = img.convert("RGBA") # reduce() não trabalha com imagens de paleta
+    try:
+        return img.reduce(fator)
+    except ValueError:
+        return img # Modos que reduce() não aceita (ex.: "1", "I;16"): o resize de quem chamou faz a redução
+
+def _float32(valor):
+    """Arredonda para precisão simples, como as contas do Image.blend em C."""
+    return struct.unpack("f", struct.pack("f", valor))[0]
+
+def _misturar(valor, destino, alpha):
+    """Um canal de Image.blend(valor, destino, alpha), com o mesmo arredondamento."""
+    return int(_float32(valor + _float32(alpha * (destino - valor))))
+
+def paleta_g1(cor, opacidade=0):
+    """
+    Paleta de 256 cores (lista de 768 valores) que leva cada nível de cinza de g1
+    à sua cor final. Equivale a ImageOps.colorize(black="black", white=cor) seguido
+    de Image.blend com preto sólido na opacidade dada, com o mesmo arredondamento.
+    """
+    canais = ImageColor.getrgb(cor)[:3]
+    alpha = _float32(opacidade / 100.0)
+    paleta = []
+    for nivel in range(256):
+        for canal in canais:
+            valor = nivel * canal // 255
+            if opacidade > 0:
+                valor = _misturar(valor, 0, alpha)
+            paleta.append(valor)
+    return paleta
+
+def escurecer(img, opacidade):
+    """
+    Aplica a opacidade de uma camada preta sólida a uma imagem RGBA como uma
+    multiplicação escalar por canal (uma tabela em point), com o mesmo resultado
+    de Image.blend(img, preto, opacidade / 100).
+    """
+    if opacidade <= 0:
+        return img
+    alpha = _float32(opacidade / 100.0)
+    tabela_rgb = [_misturar(valor, 0, alpha) for valor in range(256)]
+    tabela_alpha = [_misturar(valor, 255, alpha) for valor in range(256)]
+    return img.point(tabela_rgb * 3 + tabela_alpha)
+
+# Resultado de camada_preta_solida, por (caminho, mtime, tamanho do arquivo)
+_cache_camada_solida = {}
+
+def camada_preta_solida(caminho_black):
+    """
+    Indica se a camada de escurecimento é preto sólido: black.png ausente ou
+    com todos os pixels (0, 0, 0, 255). Nesse caso a opacidade pode ser aplicada
+    de forma analítica, sem abrir, redimensionar e mesclar o arquivo.
+    """
+    try:
+        info = os.stat(caminho_black)
+    except FileNotFoundError:
+        return True
+    chave = (caminho_black, info.st_mtime_ns, info.st_size)
+    if chave not in _cache_camada_solida:
+        extremos = Image.open(caminho_black).convert("RGBA").getextrema()
+        _cache_camada_solida[chave] = extremos == ((0, 0), (0, 0), (0, 0), (255, 255))
+    return _cache_camada_solida[chave]
+
+def colorir_g1(img_l, cor, opacidade=0):
+    """
+    Colore uma imagem em tons de cinza ("L") trocando apenas a sua paleta, em vez
+    de recalcular pixel a pixel. Retorna uma imagem RGBA.
+    """
+    img = img_l.copy()
+    img.putpalette(paleta_g1(cor, opacidade))
+    return img.convert("RGBA")
+
+# Miniaturas de g1/black já reduzidas, por (caminho, mtime, tamanho, modo)
+_cache_miniaturas = {}
+_CACHE_MINIATURAS_MAX = 32
+
+def _miniatura(caminho, tamanho, modo):
+    """Abre 'caminho' reduzido para 'tamanho' no modo pedido, reaproveitando o cache se o arquivo não mudou."""
+    chave = (caminho, os.path.getmtime(caminho), tamanho, modo)
+    miniatura = _cache_miniaturas.get(chave)
+    if miniatura is None:
+        miniatura = carregar_reduzida(caminho, tamanho).convert(modo).resize(tamanho, Image.Resampling.LANCZOS)
+        if len(_cache_miniaturas) >= _CACHE_MINIATURAS_MAX:
+            _cache_miniaturas.pop(next(iter(_cache_miniaturas)))
+        _cache_miniaturas[chave] = miniatura
+    return miniatura
+
+def miniatura_fundo(preset_info, base_dir, tamanho=(146, 96)):
+    """
+    Camada de fundo do preset (como em gerar_imagem_final) já reduzida para
+    'tamanho'. g1 fica guardada reduzida em tons de cinza, então mudar a cor ou
+    a opacidade do preset só recalcula a paleta. Retorna None se não houver g1.png.
+    """
+    pasta = os.path.join(base_dir, preset_info["code"])
+    caminho_g1 = os.path.join(pasta, "g1.png")
+    caminho_black = os.path.join(pasta, "black.png")
+    opacidade = preset_info.get("opacidade", 0)
+
+    if not os.path.exists(caminho_g1):
+        return None
+
+    if camada_preta_solida(caminho_black):
+        if preset_info.get("no_color", False):
+            return escurecer(_miniatura(caminho_g1, tamanho, "RGBA"), opacidade).copy()
+        return colorir_g1(_miniatura(caminho_g1, tamanho, "L"), preset_info["color"], opacidade)
+
+    if preset_info.get("no_color", False):
+        fundo = _miniatura(caminho_g1, tamanho, "RGBA").copy()
+    else:
+        fundo = colorir_g1(_miniatura(caminho_g1, tamanho, "L"), preset_info["color"])
+
+    if opacidade > 0:
+        fundo = Image.blend(fundo, _miniatura(caminho_black, tamanho, "RGBA"), opacidade / 100.0)
+    return fundo
+
+# Pasta (dentro de base_dir) com as miniaturas da galeria salvas em disco
+PASTA_CACHE_MINIATURAS = os.path.join(".cache", "thumbs")
+
+def carregar_miniatura(caminho, tamanho, base_dir):
+    """
+    Retorna a miniatura RGBA de 'caminho' no tamanho pedido, usando o cache em
+    disco (PASTA_CACHE_MINIATURAS). Cada miniatura guarda o mtime, o tamanho do
+    arquivo de origem e as dimensões; se algum deles mudar ela é refeita.
+    """
+    info = os.stat(caminho)
+    largura, altura = tamanho
+    identidade = f"{info.st_mtime_ns}:{info.st_size}:{largura}x{altura}"
+    pasta_cache = os.path.join(base_dir, PASTA_CACHE_MINIATURAS)
+    caminho_cache = os.path.join(pasta_cache, f"{_nome_cache_miniatura(caminho)}_{largura}x{altura}.png")
+
+    try:
+        with Image.open(caminho_cache) as miniatura:
+            if miniatura.info.get("origem") == identidade:
+                return miniatura.convert("RGBA")
+        # A imagem mudou: a miniatura antiga sai agora, mesmo que a nova não possa ser gerada
+        os.remove(caminho_cache)
+    except (OSError, ValueError):
+        pass # Ainda não está no cache (ou o arquivo do cache está corrompido)
+
+    miniatura = carregar_reduzida(caminho, tamanho).resize(tamanho).convert("RGBA")
+    try:
+        os.makedirs(pasta_cache, exist_ok=True)
+        metadados = PngImagePlugin.PngInfo()
+        metadados.add_text("origem", identidade)
+        # Atômico: duas threads podem gerar a mesma miniatura, e um arquivo pela metade não pode virar cache válido
+        buffer = io.BytesIO()
+        miniatura.save(buffer, "PNG", pnginfo=metadados, compress_level=1)
+        gravar_atomico(caminho_cache, buffer.getvalue())
+    except OSError as e:
+        print(f"Erro ao salvar miniatura no cache: {e}")
+    return miniatura
+
+def _nome_cache_miniatura(caminho):
+    return hashlib.sha1(os.path.abspath(caminho).encode("utf-8")).hexdigest()
+
+def remover_miniaturas(caminhos, base_dir):
+    """
+    Apaga do cache em disco as miniaturas (de qualquer tamanho) das imagens em
+    'caminhos', para as de imagens excluídas não ficarem para sempre. Retorna
+    quantas foram apagadas.
+    """
+    prefixos = {f"{_nome_cache_miniatura(caminho)}_" for caminho in caminhos}
+    pasta_cache = os.path.join(base_dir, PASTA_CACHE_MINIATURAS)
+    if not prefixos or not os.path.isdir(pasta_cache):
+        return 0
+    apagadas = 0
+    for arquivo in os.listdir(pasta_cache):
+        if arquivo[:41] in prefixos:
+            try:
+                os.remove(os.path.join(pasta_cache, arquivo))
+                apagadas += 1
+            except OSError:
+                pass
+    return apagadas
+
+def gerar_miniatura_galeria(nome, caminho, g1_base_para_fundo, base_dir, tamanho=(146, 96)):
+    """Monta a miniatura de uma imagem da galeria, sobre o fundo se houver."""
+    # Se a imagem atual for a g1.png, o thumbnail dela é a própria base de fundo
+    if nome == "g1.png" and g1_base_para_fundo:
+        return g1_base_para_fundo
+    # Para as outras imagens, carrega e as coloca sobre a base de fundo
+    imagem_principal_pil = carregar_miniatura(caminho, tamanho, base_dir)
+    if g1_base_para_fundo:
+        fundo = g1_base_para_fundo.copy()
+        fundo.paste(imagem_principal_pil, (0, 0), imagem_principal_pil)
+        return fundo
+    return imagem_principal_pil
+
 def carregar_g1_colorido(preset_code, cor, opacidade, no_color, base_dir):
     """Carrega a imagem g1.png, a colore (ou não), aplica opacidade e redimensiona."""
     pasta = os.path.join(base_dir, preset_code)
     caminho_g1 = os.path.join(pasta, "g1.png")
     caminho_black = os.path.join(pasta, "black.png")
 
-    if not os.path.exists(caminho_g1):
+    if "g1.png" not in carregar_indice(pasta, completo=False):
         return None
     
     try:
+        solida = camada_preta_solida(caminho_black)
         # --- LÓGICA ATUALIZADA ---
         if no_color:
             # Se a opção "no color" estiver ativa, carrega a imagem em modo RGBA diretamente.
-            colorida = Image.open(caminho_g1).convert("RGBA")
+            colorida = carregar_reduzida(caminho_g1, (146, 96)).convert("RGBA")
+            if solida:
+                return escurecer(colorida, opacidade).resize((146, 96))
+        elif solida:
+            # Com preto sólido a opacidade é um escurecimento uniforme: vai direto na paleta
+            img = carregar_reduzida(caminho_g1, (146, 96)).convert("L")
+            return colorir_g1(img, cor, opacidade).resize((146, 96))
         else:
-            # Caso contrário, aplica o efeito de cor como antes.
-            img = Image.open(caminho_g1).convert("L")
-            colorida = ImageOps.colorize(img, black="black", white=cor).convert("RGBA")
+            # Caso contrário, aplica o efeito de cor pela paleta.
+            img = carregar_reduzida(caminho_g1, (146, 96)).convert("L")
+            colorida = colorir_g1(img, cor)
 
-        # A lógica de opacidade continua a mesma
+        # Só chega aqui com um black.png personalizado
         if opacidade > 0:
-            if os.path.exists(caminho_black):
-                img_black = Image.open(caminho_black).convert("RGBA")
-                if img_black.size != colorida.size:
-                    img_black = img_black.resize(colorida.size, Image.Resampling.LANCZOS)
-            else:
-                img_black = Image.new("RGBA", colorida.size, (0, 0, 0, 255))
+            img_black = carregar_reduzida(caminho_black, (146, 96)).convert("RGBA")
+            if img_black.size != colorida.size:
+                img_black = img_black.resize(colorida.size, Image.Resampling.LANCZOS)
             
             alpha = opacidade / 100.0
             final = Image.blend(colorida, img_black, alpha)
@@ -102,75 +804,918 @@ def carregar_g1_colorido(preset_code, cor, opacidade, no_color, base_dir):
         print(f"Erro ao carregar g1.png colorido: {e}")
         return None
     
-def gerar_imagem_final(preset_info, imagem_principal_path, base_dir):
+# Arquivo (dentro da pasta de saída) que guarda a chave de cada imagem gerada
+MANIFESTO_ARQUIVO = ".manifest.json"
+# Incrementar quando a forma de compor as imagens mudar, para invalidar o manifesto
+VERSAO_RENDER = 1
+# Motor de composição usado por padrão. O "numpy" é opcional (ContextoRender(motor="numpy")
+# ou --engine numpy no cli.py): nos benchmarks ele foi mais lento que o Pillow em todas as etapas
+MOTOR_PADRAO = "pillow"
+MOTORES = ("pillow", "numpy")
+
+# Buffers temporários do motor NumPy, reaproveitados por thread
+_buffers_numpy = threading.local()
+
+def tabela_colorize(cor, opacidade=0):
+    """
+    Tabela (256 x 4, uint8) equivalente a ImageOps.colorize(black="black", white=cor)
+    seguido de convert("RGBA"): a cor de cada nível de cinza, com alpha 255.
+    Com 'opacidade', inclui também o escurecimento por preto sólido (veja paleta_g1).
+    """
+    _importar_numpy()
+    tabela = np.empty((256, 4), dtype=np.uint8)
+    tabela[:, :3] = np.array(paleta_g1(cor, opacidade), dtype=np.uint8).reshape(256, 3)
+    tabela[:, 3] = 255
+    return tabela
+
+def _processar_fundo_numpy(caminho_g1, caminho_black, cor, opacidade, no_color, solida):
+    """Versão NumPy de processar_fundo: colorização por tabela e blend em uma única passada."""
+    _importar_numpy()
+    if no_color:
+        with medir_etapa("decodificacao", "g1.png") as e:
+            fundo_base = Image.open(caminho_g1).convert("RGBA")
+            e.bytes = _bytes_imagem(fundo_base)
+        if solida:
+            with medir_etapa("colorizacao") as e:
+                e.bytes = _bytes_imagem(fundo_base)
+                return escurecer(fundo_base, opacidade)
+        fundo = np.asarray(fundo_base)
+    else:
+        with medir_etapa("decodificacao", "g1.png") as e:
+            niveis = np.asarray(Image.open(caminho_g1).convert("L"))
+            e.bytes = niveis.nbytes
+        with medir_etapa("colorizacao") as e:
+            e.bytes = niveis.nbytes * 4
+            if solida:
+                # Cor e opacidade numa única tabela: uma só consulta por pixel
+                return Image.fromarray(tabela_colorize(cor, opacidade)[niveis])
+            fundo = tabela_colorize(cor)[niveis]
+
+    if opacidade > 0:
+        with medir_etapa("decodificacao", "black.png") as e:
+            img_black = Image.open(caminho_black).convert("RGBA")
+            e.bytes = _bytes_imagem(img_black)
+        altura, largura = fundo.shape[:2]
+        if img_black.size != (largura, altura):
+            with medir_etapa("redimensionamento", "black.png") as e:
+                img_black = img_black.resize((largura, altura), Image.Resampling.LANCZOS)
+                e.bytes = _bytes_imagem(img_black)
+        # Mesma fórmula do Image.blend: fundo + alpha * (black - fundo), truncado
+        with medir_etapa("mistura") as e:
+            e.bytes = fundo.nbytes
+            alpha = np.float32(opacidade / 100.0)
+            mistura = np.asarray(img_black).astype(np.float32)
+            mistura -= fundo
+            mistura *= alpha
+            mistura += fundo
+            fundo = mistura.astype(np.uint8)
+    return Image.fromarray(np.ascontiguousarray(fundo))
+
+def _buffer_numpy(nome, forma, dtype):
+    """Devolve um buffer temporário da thread atual com a forma pedida, realocando só quando cresce."""
+    tamanho = int(np.prod(forma))
+    buffer = getattr(_buffers_numpy, nome, None)
+    if buffer is None or buffer.size < tamanho:
+        buffer = np.empty(tamanho, dtype=dtype)
+        setattr(_buffers_numpy, nome, buffer)
+    return buffer[:tamanho].reshape(forma)
+
+def compor_numpy(fundo, imagem, caixa=None):
+    """
+    Cola 'imagem' (RGBA) sobre 'fundo' (array H x W x 4, uint8) usando o alpha da
+    própria imagem como máscara, com a mesma aritmética inteira do paste do Pillow.
+    Só a região onde a imagem não é transparente ('caixa', calculada se não for
+    passada) é processada; os buffers intermediários são reaproveitados entre
+    chamadas da mesma thread.
+    """
+    _importar_numpy()
+    saida = np.array(fundo)
+    if caixa is None:
+        caixa = imagem.getchannel("A").getbbox()
+    if caixa is None:
+        return Image.fromarray(saida)
+
+    x0, y0, x1, y1 = caixa
+    sobre = np.asarray(imagem.crop(caixa))
+    destino = saida[y0:y1, x0:x1]
+    forma = sobre.shape
+    a = _buffer_numpy("a", forma, np.uint16)
+    b = _buffer_numpy("b", forma, np.uint16)
+    inversa = _buffer_numpy("inversa", forma[:2] + (1,), np.uint8)
+
+    mascara = sobre[..., 3:4]
+    np.multiply(sobre, mascara, out=a, dtype=np.uint16)
+    np.subtract(255, mascara, out=inversa)
+    np.multiply(destino, inversa, out=b, dtype=np.uint16)
+    a += b
+    # Divisão por 255 com arredondamento, como o DIV255 do Pillow
+    a += 128
+    np.right_shift(a, 8, out=b)
+    a += b
+    np.right_shift(a, 8, out=a)
+    np.copyto(destino, a, casting="unsafe")
+    return Image.fromarray(saida)
+
+def processar_fundo(preset_info, base_dir, motor=None, indice=None):
+    """
+    Gera a camada de fundo de um preset (g1 colorida ou não, com a opacidade
+    aplicada) em tamanho real. Retorna None se o preset não tiver g1.png.
+    'indice' é o índice da pasta do preset, se já tiver sido carregado.
+    """
+    pasta = os.path.join(base_dir, preset_info["code"])
+    caminho_g1 = os.path.join(pasta, "g1.png")
+    caminho_black = os.path.join(pasta, "black.png")
+    cor = preset_info["color"]
+    opacidade = preset_info.get("opacidade", 0)
+    no_color = preset_info.get("no_color", False)
+
+    if indice is None:
+        indice = carregar_indice(pasta)
+    if "g1.png" not in indice:
+        return None
+
+    # Com preto sólido (ou sem black.png) a opacidade é aplicada sem abrir o arquivo
+    solida = camada_preta_solida(caminho_black)
+
+    if (motor or MOTOR_PADRAO) == "numpy":
+        return _processar_fundo_numpy(caminho_g1, caminho_black, cor, opacidade, no_color, solida)
+
+    # Decide se a base será colorida ou a imagem original
+    if no_color:
+        with medir_etapa("decodificacao", "g1.png") as e:
+            fundo_base = Image.open(caminho_g1).convert("RGBA")
+            e.bytes = _bytes_imagem(fundo_base)
+        if solida:
+            with medir_etapa("colorizacao") as e:
+                e.bytes = _bytes_imagem(fundo_base)
+                return escurecer(fundo_base, opacidade)
+    else:
+        with medir_etapa("decodificacao", "g1.png") as e:
+            img_l = Image.open(caminho_g1).convert("L")
+            e.bytes = _bytes_imagem(img_l)
+        with medir_etapa("colorizacao") as e:
+            e.bytes = _bytes_imagem(img_l) * 4
+            if solida:
+                return colorir_g1(img_l, cor, opacidade)
+            fundo_base = colorir_g1(img_l, cor)
+
+    # Aplica o overlay de opacidade de um black.png personalizado, se necessário
+    if opacidade > 0:
+        with medir_etapa("decodificacao", "black.png") as e:
+            img_black = Image.open(caminho_black).convert("RGBA")
+            e.bytes = _bytes_imagem(img_black)
+        if img_black.size != fundo_base.size:
+            with medir_etapa("redimensionamento", "black.png") as e:
+                img_black = img_black.resize(fundo_base.size, Image.Resampling.LANCZOS)
+                e.bytes = _bytes_imagem(img_black)
+        with medir_etapa("mistura") as e:
+            e.bytes = _bytes_imagem(fundo_base)
+            alpha = opacidade / 100.0
+            return Image.blend(fundo_base, img_black, alpha)
+    return fundo_base
+
+class ContextoRender:
+    """
+    Guarda a camada de fundo já processada de um preset para que todas as
+    imagens de uma mesma geração reaproveitem o mesmo g1/black, em vez de
+    reabrir, colorir e mesclar os arquivos a cada imagem.
+
+    'motor' escolhe entre "numpy" e "pillow" (padrão: MOTOR_PADRAO). Os dois
+    produzem o mesmo resultado, com diferença máxima de 1 por canal.
+    """
+    def __init__(self, preset_info, base_dir, motor=None):
+        if motor is not None and motor not in MOTORES:
+            raise ValueError(f"Motor de composição desconhecido: '{motor}'. Disponíveis: {', '.join(MOTORES)}")
+        if motor == "numpy":
+            try:
+                _importar_numpy()
+            except ImportError:
+                raise ValueError("O motor 'numpy' foi pedido, mas o NumPy não está instalado.")
+        self.preset_info = preset_info
+        self.base_dir = base_dir
+        self.motor = motor or MOTOR_PADRAO
+        self.pasta = os.path.join(base_dir, preset_info["code"])
+        self.caminho_g1 = os.path.join(self.pasta, "g1.png")
+        self.caminho_black = os.path.join(self.pasta, "black.png")
+        self._lock = threading.RLock()
+        self._fundo_pronto = False
+        self._fundo = None
+        self._fundo_array = None
+        self._hash_base = None
+        self._indice = None
+
+    @property
+    def indice(self):
+        """Índice da pasta do preset (carregar_indice), lido uma única vez por contexto."""
+        with self._lock:
+            if self._indice is None:
+                self._indice = carregar_indice(self.pasta)
+            return self._indice
+
+    def entrada(self, caminho):
+        """Entrada do índice para 'caminho', ou None se ele não estiver na pasta do preset."""
+        if os.path.normpath(os.path.dirname(caminho)) != os.path.normpath(self.pasta):
+            return None
+        return self.indice.get(os.path.basename(caminho))
+
+    def hash_imagem(self, caminho):
+        """
+        Hash do conteúdo de 'caminho': o do índice, se a imagem estiver nele; se
+        não, o arquivo é lido. Retorna (hash, dados), com os bytes lidos ou None.
+        """
+        entrada = self.entrada(caminho)
+        if entrada and entrada["hash"] is not None:
+            return entrada["hash"], None
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        return hashlib.sha256(dados).hexdigest(), dados
+
+    def caixa_alpha(self, caminho):
+        """Caixa onde o alpha de 'caminho' não é zero, do índice (None se não for conhecida)."""
+        entrada = self.entrada(caminho)
+        if entrada and entrada["caixa_alpha"] is not None:
+            return tuple(entrada["caixa_alpha"])
+        return None
+
+    @property
+    def fundo(self):
+        """Camada de fundo, gerada só no primeiro acesso (execuções sem mudanças nem chegam a gerá-la)."""
+        with self._lock:
+            if not self._fundo_pronto:
+                self._fundo = processar_fundo(self.preset_info, self.base_dir, self.motor, self.indice)
+                self._fundo_pronto = True
+            return self._fundo
+
+    @property
+    def fundo_array(self):
+        """Camada de fundo como array NumPy (H x W x 4), usada pelo motor "numpy"."""
+        with self._lock:
+            if self._fundo_array is None and self.fundo is not None:
+                self._fundo_array = np.asarray(self.fundo)
+            return self._fundo_array
+
+    @property
+    def hash_base(self):
+        """Hash dos bytes de g1/black e dos parâmetros do preset que afetam o resultado."""
+        with self._lock:
+            if self._hash_base is None:
+                h = hashlib.sha256()
+                parametros = {
+                    "versao": VERSAO_RENDER,
+                    "motor": self.motor,
+                    "color": self.preset_info["color"],
+                    "opacidade": self.preset_info.get("opacidade", 0),
+                    "no_color": self.preset_info.get("no_color", False),
+                }
+                h.update(json.dumps(parametros, sort_keys=True).encode("utf-8"))
+                # Os hashes do conteúdo de g1/black vêm do índice da pasta
+                for caminho in (self.caminho_g1, self.caminho_black):
+                    h.update(b"\0")
+                    if self.entrada(caminho):
+                        h.update(self.hash_imagem(caminho)[0].encode("ascii"))
+                self._hash_base = h.hexdigest()
+            return self._hash_base
+
+def gerar_imagem_final(preset_info, imagem_principal_path, base_dir, contexto=None, dados=None):
     """
     Processa uma imagem individual com base nas configurações do preset,
     mantendo seu tamanho original.
+
+    Se um ContextoRender for passado, a camada de fundo dele é reaproveitada
+    em vez de ser gerada novamente a partir de g1.png e black.png. Se 'dados'
+    (os bytes do arquivo, já lidos) for passado, a imagem não é lida do disco.
     """
     try:
-        # Carrega a imagem principal que será a camada de cima
-        imagem_principal = Image.open(imagem_principal_path).convert("RGBA")
-        
-        # Pega as configurações do preset
-        preset_code = preset_info["code"]
-        cor = preset_info["color"]
-        opacidade = preset_info.get("opacidade", 0)
-        no_color = preset_info.get("no_color", False)
-        
-        # Define os caminhos para g1 e black
-        pasta = os.path.join(base_dir, preset_code)
-        caminho_g1 = os.path.join(pasta, "g1.png")
-        caminho_black = os.path.join(pasta, "black.png")
+        if contexto is None:
+            contexto = ContextoRender(preset_info, base_dir)
 
         # Se a imagem principal for a própria g1.png, ela se torna a base
-        if os.path.normpath(imagem_principal_path) == os.path.normpath(caminho_g1):
-             # Decide se a base será colorida ou a imagem original
-            if no_color:
-                imagem_base = Image.open(caminho_g1).convert("RGBA")
-            else:
-                img_l = Image.open(caminho_g1).convert("L")
-                imagem_base = ImageOps.colorize(img_l, black="black", white=cor).convert("RGBA")
-            
-            # Aplica o overlay de opacidade, se necessário
-            if opacidade > 0 and os.path.exists(caminho_black):
-                img_black = Image.open(caminho_black).convert("RGBA")
-                if img_black.size != imagem_base.size:
-                    img_black = img_black.resize(imagem_base.size, Image.Resampling.LANCZOS)
-                alpha = opacidade / 100.0
-                return Image.blend(imagem_base, img_black, alpha)
-            else:
-                return imagem_base
+        if os.path.normpath(imagem_principal_path) == os.path.normpath(contexto.caminho_g1):
+            return contexto.fundo.copy()
+
+        # Carrega a imagem principal que será a camada de cima
+        origem = io.BytesIO(dados) if dados is not None else imagem_principal_path
+        with medir_etapa("decodificacao", os.path.basename(imagem_principal_path)) as e:
+            imagem_principal = Image.open(origem).convert("RGBA")
+            e.bytes = _bytes_imagem(imagem_principal)
+
+        # A caixa do alpha já está no índice; evita percorrer a imagem de novo
+        return compor_sobre_fundo(contexto, imagem_principal, contexto.caixa_alpha(imagem_principal_path))
+
+    except Exception as e:
+        print(f"Erro ao gerar imagem final para '{os.path.basename(imagem_principal_path)}': {e}")
+        return None
+
+def compor_sobre_fundo(contexto, imagem_principal, caixa_alpha=None):
+    """
+    Cola 'imagem_principal' (RGBA, já decodificada) sobre o fundo do contexto e
+    retorna uma imagem nova; 'imagem_principal' não é alterada, então pode ser
+    compartilhada entre presets. 'caixa_alpha' é a caixa do índice, válida só
+    no tamanho original da imagem.
+    """
+    if contexto.fundo is None:
+        # Sem g1, a imagem vai sem fundo; copiada, porque a original pode ser a sobreposição compartilhada
+        return imagem_principal.copy()
 
-        # Se a imagem principal NÃO for g1.png, cria a base a partir de g1
+    # Redimensiona a imagem principal para o tamanho do fundo, se necessário
+    if imagem_principal.size != contexto.fundo.size:
+        with medir_etapa("redimensionamento") as e:
+            imagem_principal = imagem_principal.resize(contexto.fundo.size, Image.Resampling.LANCZOS)
+            e.bytes = _bytes_imagem(imagem_principal)
+        caixa_alpha = None
+
+    with medir_etapa("colagem") as e:
+        e.bytes = _bytes_imagem(imagem_principal)
+        if contexto.motor == "numpy":
+            return compor_numpy(contexto.fundo_array, imagem_principal, caixa_alpha)
+
+        # Copia o fundo para não alterar a camada compartilhada do contexto
+        fundo_final = contexto.fundo.copy()
+
+        # Combina o fundo com a imagem principal
+        fundo_final.paste(imagem_principal, (0, 0), imagem_principal)
+        return fundo_final
+
+# --- CODIFICAÇÃO DA SAÍDA ---
+# Configuração completa do codificador; os perfis e os presets só sobrescrevem o que mudar.
+# compress_level 6 é o padrão do Pillow, então o perfil "padrao" gera os mesmos PNGs de antes.
+SAIDA_PADRAO = {
+    "formato": "png",      # "png", "webp" ou "jpeg"
+    "compress_level": 6,   # PNG: 0 (sem compressão, mais rápido) a 9 (menor arquivo)
+    "optimize": False,     # PNG: procura os melhores filtros (bem mais lento)
+    "lossless": True,      # WebP: sem perdas
+    "quality": 90,         # JPEG e WebP com perdas: qualidade; WebP sem perdas: esforço
+    "method": 4,           # WebP: 0 (rápido) a 6 (menor arquivo)
+    "tamanhos": [],        # Variantes [largura, altura] além da resolução original, salvas como nome_LxA
+}
+PERFIS_SAIDA = {
+    "padrao": {},
+    "rapido": {"compress_level": 1},
+    "sem_compressao": {"compress_level": 0},
+    "compacto": {"compress_level": 9, "optimize": True},
+    "webp": {"formato": "webp", "lossless": True, "quality": 50, "method": 0},
+    "webp_com_perdas": {"formato": "webp", "lossless": False, "quality": 90},
+    "jpeg": {"formato": "jpeg", "quality": 92},
+    "resolucoes": {"tamanhos": [[1920, 1080], [1280, 720], [320, 180]]},
+}
+PERFIL_SAIDA_PADRAO = "padrao"
+_EXTENSOES_SAIDA = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+def config_saida(preset_info=None, saida=None):
+    """
+    Monta a configuração do codificador: SAIDA_PADRAO, depois a do preset
+    (preset_info["saida"]) e por último a da execução ('saida'). Cada nível
+    pode ser o nome de um perfil de PERFIS_SAIDA ou um dict com as chaves a mudar,
+    opcionalmente com "perfil" (ex.: {"perfil": "webp_com_perdas", "quality": 80}).
+    """
+    config = dict(SAIDA_PADRAO)
+    for nivel in ((preset_info or {}).get("saida"), saida):
+        if not nivel:
+            continue
+        if isinstance(nivel, dict):
+            nivel = dict(nivel)
+            perfil = nivel.pop("perfil", None)
+            if perfil:
+                config.update(_perfil(perfil))
         else:
-            if not os.path.exists(caminho_g1):
-                return imagem_principal # Retorna a imagem sem fundo se g1 não existir
+            nivel = _perfil(nivel)
+        config.update(nivel)
+    if config["formato"] not in _EXTENSOES_SAIDA:
+        raise ValueError(f"Formato de saída desconhecido: '{config['formato']}'")
+    if not 0 <= config["compress_level"] <= 9:
+        raise ValueError("compress_level deve estar entre 0 e 9")
+    try:
+        config["tamanhos"] = [[int(largura), int(altura)] for largura, altura in config["tamanhos"]]
+    except (TypeError, ValueError):
+        raise ValueError("tamanhos deve ser uma lista de [largura, altura]")
+    if any(largura <= 0 or altura <= 0 for largura, altura in config["tamanhos"]):
+        raise ValueError("As larguras e alturas de tamanhos devem ser positivas")
+    return config
+
+def _perfil(nome):
+    if nome not in PERFIS_SAIDA:
+        raise ValueError(f"Perfil de saída desconhecido: '{nome}'. Disponíveis: {', '.join(PERFIS_SAIDA)}")
+    return PERFIS_SAIDA[nome]
+
+def perfil_saida(saida):
+    """Nome do perfil de uma configuração de saída de preset (nome ou dict com "perfil")."""
+    if isinstance(saida, dict):
+        return saida.get("perfil") or PERFIL_SAIDA_PADRAO
+    return saida or PERFIL_SAIDA_PADRAO
+
+def saidas_obsoletas(pasta_output, manifesto, nomes):
+    """
+    Quando o formato muda, a saída de uma imagem troca de extensão e a antiga
+    ficaria para trás. Retorna {nome_atual: [(nome_antigo, [arquivos])]} com as
+    entradas do manifesto cuja imagem ainda está em 'nomes', mas com outra
+    extensão, e os arquivos delas (incluindo as variantes de tamanho).
+    """
+    atuais = {os.path.splitext(nome)[0]: nome for nome in nomes}
+    obsoletas = [nome for nome in manifesto if atuais.get(os.path.splitext(nome)[0], nome) != nome]
+    if not obsoletas:
+        return {}
+    try:
+        arquivos = os.listdir(pasta_output)
+    except OSError:
+        arquivos = []
+    resultado = {}
+    for nome in obsoletas:
+        base, ext = os.path.splitext(nome)
+        padrao = re.compile(rf"{re.escape(base)}(_\d+x\d+)?{re.escape(ext)}")
+        resultado.setdefault(atuais[base], []).append((nome, [a for a in arquivos if padrao.fullmatch(a)]))
+    return resultado
+
+def remover_saidas_obsoletas(pasta_output, manifesto, obsoletas):
+    """Apaga as saídas antigas de uma imagem (veja saidas_obsoletas), depois que a nova foi gravada."""
+    for nome, arquivos in obsoletas:
+        manifesto.pop(nome, None)
+        for arquivo in arquivos:
+            try:
+                os.remove(os.path.join(pasta_output, arquivo))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Erro ao apagar a saída antiga '{arquivo}': {e}")
 
-            # Cria a camada de fundo (base) processada
-            if no_color:
-                fundo_base = Image.open(caminho_g1).convert("RGBA")
+def nome_saida(nome, config):
+    """Nome do arquivo de saída: o da imagem, com a extensão trocada se o formato pedir outra."""
+    base, ext = os.path.splitext(nome)
+    extensao = _EXTENSOES_SAIDA[config["formato"]]
+    if ext.lower() == extensao or (extensao == ".jpg" and ext.lower() == ".jpeg"):
+        return nome
+    return base + extensao
+
+def nomes_saida(caminhos, config):
+    """
+    Nomes de saída de todas as imagens de uma pasta (veja nome_saida), sem
+    repetições: se duas imagens ficariam com o mesmo nome (ex.: foto.jpg e
+    foto.png em PNG), as que teriam a extensão trocada mantêm o nome inteiro
+    e ganham a nova extensão no fim (foto.jpg.png).
+    """
+    nomes = [os.path.basename(caminho) for caminho in caminhos]
+    candidatos = [nome_saida(nome, config) for nome in nomes]
+    contagem = {}
+    for candidato in candidatos:
+        contagem[candidato] = contagem.get(candidato, 0) + 1
+    extensao = _EXTENSOES_SAIDA[config["formato"]]
+    return [candidato if contagem[candidato] == 1 or candidato == nome else nome + extensao
+            for nome, candidato in zip(nomes, candidatos)]
+
+def caminhos_saida(caminho_saida, config):
+    """
+    Arquivos gerados para uma imagem: [(tamanho, caminho)], começando pela
+    resolução original (tamanho None, em caminho_saida) e seguida pelas
+    variantes de config["tamanhos"], com o tamanho no nome (ex.: louvor_1280x720.png).
+    """
+    base, ext = os.path.splitext(caminho_saida)
+    return [(None, caminho_saida)] + [(tuple(t), f"{base}_{t[0]}x{t[1]}{ext}") for t in config["tamanhos"]]
+
+def redimensionar_variante(imagem, tamanho):
+    """
+    Reduz a imagem composta para 'tamanho'. Se o tamanho for a resolução
+    original dividida por um inteiro (ex.: 2560x1440 -> 1280x720), usa reduce(),
+    que só tira a média de blocos de pixels; senão, LANCZOS.
+    """
+    if tamanho is None or imagem.size == tamanho:
+        return imagem
+    largura, altura = imagem.size
+    with medir_etapa("redimensionamento", f"{tamanho[0]}x{tamanho[1]}") as e:
+        e.bytes = _bytes_imagem(imagem)
+        if largura % tamanho[0] == 0 and altura % tamanho[1] == 0 and largura // tamanho[0] == altura // tamanho[1]:
+            return imagem.reduce(largura // tamanho[0])
+        return imagem.resize(tamanho, Image.Resampling.LANCZOS)
+
+def salvar_variantes(imagem_final, caminho_saida, config):
+    """
+    Codifica e grava a imagem composta e todas as suas variantes de tamanho.
+    Retorna "gerada" se algum arquivo mudou, senão "inalterada".
+    """
+    situacoes = [gravar_saida(caminho, codificar_imagem(redimensionar_variante(imagem_final, tamanho), config))
+                 for tamanho, caminho in caminhos_saida(caminho_saida, config)]
+    return "gerada" if "gerada" in situacoes else "inalterada"
+
+def codificar_imagem(imagem, config):
+    """Codifica 'imagem' com a configuração de config_saida() e retorna os bytes."""
+    with medir_etapa("codificacao", config["formato"]) as e:
+        e.bytes = _bytes_imagem(imagem)
+        return _codificar(imagem, config)
+
+def _codificar(imagem, config):
+    buffer = io.BytesIO()
+    formato = config["formato"]
+    if formato == "png":
+        imagem.save(buffer, "PNG", compress_level=config["compress_level"], optimize=config["optimize"])
+    elif formato == "webp":
+        imagem.save(buffer, "WEBP", lossless=config["lossless"], quality=config["quality"], method=config["method"])
+    else:
+        # JPEG não tem transparência: só serve para saídas opacas (com fundo)
+        if imagem.mode == "RGBA":
+            if imagem.getchannel("A").getextrema()[0] < 255:
+                raise ValueError("JPEG não suporta transparência; use PNG ou WebP para este preset")
+            imagem = imagem.convert("RGB")
+        imagem.save(buffer, "JPEG", quality=config["quality"])
+    return buffer.getvalue()
+
+def medir_codificadores(preset_info, base_dir, perfis=None, limite=None, contexto=None):
+    """
+    Compara os perfis de saída nas imagens do próprio preset: cada imagem é
+    composta uma vez e codificada com cada perfil. Retorna uma lista de dicts
+    {perfil, imagens, segundos, bytes, erro} (tempo e bytes somados).
+    """
+    if contexto is None:
+        contexto = ContextoRender(preset_info, base_dir)
+    caminhos = [caminho for _, caminho in carregar_imagens(preset_info["code"], base_dir)]
+    if limite:
+        caminhos = caminhos[:limite]
+    imagens = [img for img in (gerar_imagem_final(preset_info, c, base_dir, contexto) for c in caminhos) if img is not None]
+
+    resultados = []
+    for perfil in (perfis or list(PERFIS_SAIDA)):
+        resultado = {"perfil": perfil, "imagens": len(imagens), "segundos": 0.0, "bytes": 0, "erro": None}
+        try:
+            config = config_saida(saida=perfil)
+            for imagem in imagens:
+                inicio = time.perf_counter()
+                dados = codificar_imagem(imagem, config)
+                resultado["segundos"] += time.perf_counter() - inicio
+                resultado["bytes"] += len(dados)
+        except ValueError as e:
+            resultado["erro"] = str(e)
+        resultados.append(resultado)
+    return resultados
+
+def carregar_manifesto(pasta_output):
+    """Carrega o manifesto da pasta de saída ({nome_imagem: chave}). Retorna {} se não existir."""
+    caminho = os.path.join(pasta_output, MANIFESTO_ARQUIVO)
+    try:
+        with open(caminho, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def salvar_manifesto(pasta_output, manifesto):
+    """Salva o manifesto, apenas se o conteúdo tiver mudado."""
+    if manifesto == carregar_manifesto(pasta_output):
+        return
+    gravar_atomico(os.path.join(pasta_output, MANIFESTO_ARQUIVO), json.dumps(manifesto, indent=4, sort_keys=True).encode("utf-8"))
+
+# Permissões de um arquivo novo (mkstemp cria só para o dono, 0600); lida uma vez, porque os.umask não é seguro entre threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _modo_arquivo(caminho):
+    """Permissões que 'caminho' deve ter: as do arquivo atual, ou as de um arquivo novo."""
+    try:
+        return os.stat(caminho).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+def gravar_atomico(caminho, dados, sincronizar=False):
+    """
+    Grava 'dados' em um arquivo temporário na mesma pasta e o move para 'caminho'
+    com os.replace, então quem lê a pasta nunca vê um arquivo pela metade.
+    Com sincronizar=True, os dados vão para o disco (fsync) antes da troca, para
+    que nem uma queda de energia deixe o arquivo truncado.
+    """
+    pasta, nome = os.path.split(caminho)
+    fd, temporario = tempfile.mkstemp(dir=pasta or ".", prefix=f".{nome}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+            if sincronizar:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(temporario, _modo_arquivo(caminho))
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+    if sincronizar and hasattr(os, "O_DIRECTORY"):
+        # O arquivo novo já está no lugar; sincronizar a pasta é só uma garantia a mais
+        try:
+            fd_pasta = os.open(pasta or ".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd_pasta)
+            finally:
+                os.close(fd_pasta)
+        except OSError:
+            pass
+
+def gravar_saida(caminho_saida, dados):
+    """Grava a saída codificada; retorna "inalterada" se o arquivo já tinha esses bytes, senão "gerada"."""
+    with medir_etapa("gravacao", os.path.basename(caminho_saida)) as e:
+        e.bytes = len(dados)
+        if os.path.exists(caminho_saida) and os.path.getsize(caminho_saida) == len(dados):
+            with open(caminho_saida, "rb") as f:
+                if f.read() == dados:
+                    return "inalterada"
+        gravar_atomico(caminho_saida, dados)
+        return "gerada"
+
+def _chave_saida(contexto, hash_imagem, config):
+    h = hashlib.sha256(hash_imagem.encode("ascii"))
+    h.update(contexto.hash_base.encode("ascii"))
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+# --- PIPELINE DE GERAÇÃO ---
+# Itens em espera entre as etapas, por thread da etapa seguinte (limita a memória:
+# cada imagem composta em 2560x1440 RGBA ocupa ~14 MB)
+PIPELINE_FILA_POR_THREAD = 2
+_FIM = object() # Marca o fim da fila de uma etapa
+
+def _colocar(fila, item, parar):
+    """put() que desiste se o pipeline for interrompido (evita travar com a fila cheia)."""
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _retirar(fila, parar):
+    while not parar.is_set():
+        try:
+            return fila.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _FIM
+
+def renderizar_lote(preset_info, caminhos, pasta_output, base_dir, workers=None, contexto=None, saida=None):
+    """
+    Gera as imagens de um preset em um pipeline de três etapas ligadas por filas
+    limitadas, para a leitura do disco e a gravação acontecerem enquanto outras
+    imagens são compostas e codificadas:
+
+    1. leitura (1 thread): calcula a chave de cada imagem, pula as que não mudaram
+       desde a última geração e lê os bytes das demais;
+    2. composição ('workers' threads): decodifica e compõe sobre o fundo;
+    3. codificação ('workers' threads): deriva cada variante de tamanho da
+       imagem composta, codifica e grava com gravar_atomico. As variantes de
+       uma mesma imagem são codificadas em paralelo, em threads diferentes.
+
+    Quando uma fila enche, a etapa anterior espera. O Pillow libera o GIL durante
+    decodificação, composição e codificação, então as threads rodam em paralelo.
+
+    A chave de cada saída é o hash dos bytes da imagem (do índice do preset,
+    quando a imagem está nele) somado ao hash de g1/black, dos parâmetros do
+    preset e do codificador. Se for igual à do manifesto e os arquivos
+    existirem, a imagem é "pulada"; se os bytes codificados forem iguais aos do
+    arquivo existente, ele não é reescrito ("inalterada").
+
+    É um gerador: devolve (nome_saida, situacao, erro) na mesma ordem de
+    'caminhos', conforme cada imagem termina, com situacao em "gerada",
+    "inalterada", "pulada" ou "erro". O manifesto da pasta de saída é
+    atualizado ao final. Por padrão usa uma
+    thread por CPU em cada etapa. 'saida' sobrescreve o perfil/configuração de
+    saída do preset só nesta execução.
+    """
+    if contexto is None:
+        contexto = ContextoRender(preset_info, base_dir)
+    if not workers:
+        workers = os.cpu_count() or 1
+    config = config_saida(preset_info, saida)
+
+    manifesto = carregar_manifesto(pasta_output)
+    tarefas = []
+    for nome, caminho in zip(nomes_saida(caminhos, config), caminhos):
+        tarefas.append((nome, caminho, os.path.join(pasta_output, nome), manifesto.get(nome)))
+    obsoletas = saidas_obsoletas(pasta_output, manifesto, [t[0] for t in tarefas])
+
+    parar = threading.Event()
+    fila_compor = queue.Queue(maxsize=workers * PIPELINE_FILA_POR_THREAD)
+    fila_codificar = queue.Queue(maxsize=workers * PIPELINE_FILA_POR_THREAD)
+    resultados = queue.Queue()
+    restantes = {"compor": workers}
+    pendentes = {} # índice -> [variantes ainda não gravadas, situações das já gravadas]
+    lock_restantes = threading.Lock()
+
+    def ler():
+        for i, (nome, caminho, caminho_saida, chave_anterior) in enumerate(tarefas):
+            if parar.is_set():
+                return
+            try:
+                hash_imagem, dados = contexto.hash_imagem(caminho)
+                chave = _chave_saida(contexto, hash_imagem, config)
+                if chave == chave_anterior and all(os.path.exists(c) for _, c in caminhos_saida(caminho_saida, config)):
+                    resultados.put((i, "pulada", chave, None))
+                    continue
+                if dados is None:
+                    with medir_etapa("leitura", os.path.basename(caminho)) as e:
+                        with open(caminho, "rb") as f:
+                            dados = f.read()
+                        e.bytes = len(dados)
+            except Exception as e:
+                resultados.put((i, "erro", None, str(e)))
+                continue
+            if not _colocar(fila_compor, (i, caminho, chave, dados), parar):
+                return
+        for _ in range(workers):
+            _colocar(fila_compor, _FIM, parar)
+
+    def compor():
+        while True:
+            item = _retirar(fila_compor, parar)
+            if item is _FIM:
+                break
+            i, caminho, chave, dados = item
+            imagem_final = gerar_imagem_final(preset_info, caminho, base_dir, contexto, dados)
+            if imagem_final is None:
+                resultados.put((i, "erro", None, "não foi possível gerar a imagem"))
+                continue
+            # Cada variante de tamanho é um item separado, para ser codificada em paralelo
+            variantes = caminhos_saida(tarefas[i][2], config)
+            with lock_restantes:
+                pendentes[i] = [len(variantes), []]
+            if not all(_colocar(fila_codificar, (i, chave, imagem_final, tamanho, destino), parar) for tamanho, destino in variantes):
+                break
+        # A última thread de composição a terminar encerra a etapa de codificação
+        with lock_restantes:
+            restantes["compor"] -= 1
+            ultima = restantes["compor"] == 0
+        if ultima:
+            for _ in range(workers):
+                _colocar(fila_codificar, _FIM, parar)
+
+    def codificar():
+        while True:
+            item = _retirar(fila_codificar, parar)
+            if item is _FIM:
+                return
+            i, chave, imagem_final, tamanho, destino = item
+            try:
+                situacao = gravar_saida(destino, codificar_imagem(redimensionar_variante(imagem_final, tamanho), config))
+            except Exception as e:
+                situacao = f"erro: {e}"
+            # A imagem termina quando a última das suas variantes for gravada
+            with lock_restantes:
+                pendentes[i][0] -= 1
+                pendentes[i][1].append(situacao)
+                if pendentes[i][0]:
+                    continue
+                situacoes = pendentes.pop(i)[1]
+            erros = [s[len("erro: "):] for s in situacoes if s.startswith("erro: ")]
+            if erros:
+                resultados.put((i, "erro", None, "; ".join(erros)))
+            else:
+                resultados.put((i, "gerada" if "gerada" in situacoes else "inalterada", chave, None))
+
+    threads = [threading.Thread(target=ler, name="leitura", daemon=True)]
+    threads += [threading.Thread(target=compor, name=f"composicao-{n}", daemon=True) for n in range(workers)]
+    threads += [threading.Thread(target=codificar, name=f"codificacao-{n}", daemon=True) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    prontos = {}
+    try:
+        for i, (nome, _, _, _) in enumerate(tarefas):
+            while i not in prontos:
+                indice, situacao, chave, erro = resultados.get()
+                prontos[indice] = (situacao, chave, erro)
+            situacao, chave, erro = prontos.pop(i)
+            if chave:
+                manifesto[nome] = chave
+                remover_saidas_obsoletas(pasta_output, manifesto, obsoletas.get(nome, ()))
             else:
-                img_l = Image.open(caminho_g1).convert("L")
-                fundo_base = ImageOps.colorize(img_l, black="black", white=cor).convert("RGBA")
-
-            # Aplica a opacidade na camada de fundo
-            if opacidade > 0 and os.path.exists(caminho_black):
-                img_black = Image.open(caminho_black).convert("RGBA")
-                if img_black.size != fundo_base.size:
-                    img_black = img_black.resize(fundo_base.size, Image.Resampling.LANCZOS)
-                alpha = opacidade / 100.0
-                fundo_final = Image.blend(fundo_base, img_black, alpha)
+                manifesto.pop(nome, None)
+            yield nome, situacao, erro
+    finally:
+        # Se quem consome o gerador parar antes do fim, as etapas são interrompidas
+        parar.set()
+        for thread in threads:
+            thread.join()
+        salvar_manifesto(pasta_output, manifesto)
+
+class _SobreposicoesCompartilhadas:
+    """
+    Sobreposições decodificadas uma única vez por hash de conteúdo e mantidas
+    só enquanto algum preset ainda precisar delas (contagem de referências).
+    """
+    def __init__(self):
+        self._imagens = {}
+        self._referencias = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.decodificadas = 0
+
+    def registrar(self, hash_imagem):
+        with self._lock:
+            self._referencias[hash_imagem] = self._referencias.get(hash_imagem, 0) + 1
+            self._locks.setdefault(hash_imagem, threading.Lock())
+
+    def obter(self, hash_imagem, caminho):
+        with self._locks[hash_imagem]:
+            imagem = self._imagens.get(hash_imagem)
+            if imagem is None:
+                with medir_etapa("decodificacao", os.path.basename(caminho)) as e:
+                    imagem = Image.open(caminho).convert("RGBA")
+                    e.bytes = _bytes_imagem(imagem)
+                self._imagens[hash_imagem] = imagem
+                with self._lock:
+                    self.decodificadas += 1
+            return imagem
+
+    def liberar(self, hash_imagem):
+        with self._lock:
+            self._referencias[hash_imagem] -= 1
+            if self._referencias[hash_imagem] == 0:
+                self._imagens.pop(hash_imagem, None)
+
+def renderizar_todos(presets, base_dir, pasta_output, workers=None, saida=None, estatisticas=None, motor=None):
+    """
+    Gera as imagens de vários presets ({nome: preset_info}) de uma vez, cada um
+    em pasta_output/<code>. As sobreposições (anuncios.png, louvor.png, ...)
+    costumam ser idênticas entre presets, copiadas de raws/: elas são agrupadas
+    pelo hash de conteúdo do índice e cada conteúdo distinto é decodificado uma
+    única vez e composto sobre o fundo de cada preset que o usa.
+
+    É um gerador: devolve (nome_preset, nome_saida, situacao, erro) na ordem dos
+    presets e das imagens. Se 'estatisticas' (um dict) for passado, recebe
+    "imagens" (compostas) e "decodificadas" (sobreposições distintas lidas).
+    'motor' é o motor de composição de todos os presets (veja ContextoRender).
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    # Monta as tarefas de todos os presets, já pulando as que não mudaram
+    tarefas = [] # (nome_preset, nome, pasta, caminho, hash|None, chave, situacao pronta|None, erro)
+    manifestos = {}
+    obsoletas = {} # pasta -> saidas_obsoletas()
+    contextos = {}
+    for nome_preset, preset_info in presets.items():
+        pasta = os.path.join(pasta_output, preset_info["code"])
+        try:
+            os.makedirs(pasta, exist_ok=True)
+            config = config_saida(preset_info, saida)
+            contexto = ContextoRender(preset_info, base_dir, motor)
+            contexto.fundo # Prepara o fundo antes das threads
+        except Exception as e:
+            tarefas.append((nome_preset, preset_info["code"], pasta, None, None, None, "erro", str(e)))
+            continue
+        contextos[nome_preset] = (contexto, config)
+        manifesto = manifestos[pasta] = carregar_manifesto(pasta)
+        imagens = carregar_imagens(preset_info["code"], base_dir)
+        nomes = nomes_saida([caminho for _, caminho in imagens], config)
+        obsoletas[pasta] = saidas_obsoletas(pasta, manifesto, nomes)
+        for nome, (_, caminho) in zip(nomes, imagens):
+            try:
+                hash_imagem, _ = contexto.hash_imagem(caminho)
+                chave = _chave_saida(contexto, hash_imagem, config)
+            except Exception as e:
+                tarefas.append((nome_preset, nome, pasta, caminho, None, None, "erro", str(e)))
+                continue
+            if chave == manifesto.get(nome) and all(os.path.exists(c) for _, c in caminhos_saida(os.path.join(pasta, nome), config)):
+                tarefas.append((nome_preset, nome, pasta, caminho, None, chave, "pulada", None))
+            elif os.path.normpath(caminho) == os.path.normpath(contexto.caminho_g1):
+                tarefas.append((nome_preset, nome, pasta, caminho, None, chave, None, None)) # O próprio fundo
             else:
-                fundo_final = fundo_base
+                tarefas.append((nome_preset, nome, pasta, caminho, hash_imagem, chave, None, None))
 
-            # Redimensiona a imagem principal para o tamanho do fundo, se necessário
-            if imagem_principal.size != fundo_final.size:
-                imagem_principal = imagem_principal.resize(fundo_final.size, Image.Resampling.LANCZOS)
+    # As tarefas do mesmo conteúdo ficam juntas, para cada sobreposição
+    # decodificada ser usada e liberada logo em seguida
+    compartilhadas = _SobreposicoesCompartilhadas()
+    ordem = sorted((i for i, t in enumerate(tarefas) if t[6] is None), key=lambda i: (tarefas[i][4] or "", i))
+    for i in ordem:
+        if tarefas[i][4]:
+            compartilhadas.registrar(tarefas[i][4])
 
-            # Combina o fundo com a imagem principal
-            fundo_final.paste(imagem_principal, (0, 0), imagem_principal)
-            return fundo_final
+    def processar(i):
+        nome_preset, nome, pasta, caminho, hash_imagem, chave, _, _ = tarefas[i]
+        contexto, config = contextos[nome_preset]
+        try:
+            if hash_imagem is None:
+                imagem_final = contexto.fundo.copy()
+            else:
+                try:
+                    imagem_final = compor_sobre_fundo(contexto, compartilhadas.obter(hash_imagem, caminho), contexto.caixa_alpha(caminho))
+                finally:
+                    compartilhadas.liberar(hash_imagem)
+            return salvar_variantes(imagem_final, os.path.join(pasta, nome), config), chave, None
+        except Exception as e:
+            return "erro", None, str(e)
 
-    except Exception as e:
-        print(f"Erro ao gerar imagem final para '{os.path.basename(imagem_principal_path)}': {e}")
-        return None
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {i: executor.submit(processar, i) for i in ordem}
+        try:
+            for i, (nome_preset, nome, pasta, _, _, chave, situacao, erro) in enumerate(tarefas):
+                if i in futuros:
+                    situacao, chave, erro = futuros[i].result()
+                if pasta in manifestos:
+                    if chave:
+                        manifestos[pasta][nome] = chave
+                        remover_saidas_obsoletas(pasta, manifestos[pasta], obsoletas[pasta].get(nome, ()))
+                    else:
+                        manifestos[pasta].pop(nome, None)
+                yield nome_preset, nome, situacao, erro
+        finally:
+            for futuro in futuros.values():
+                futuro.cancel()
+            for pasta, manifesto in manifestos.items():
+                salvar_manifesto(pasta, manifesto)
+            if estatisticas is not None:
+                estatisticas["imagens"] = len(ordem)
+                estatisticas["decodificadas"] = compartilhadas.decodificadas
@@ -1,71 +1,349 @@
 import os
 import re
+import gzip
+import json
+import time
+import queue
+import shutil
 import datetime
+import threading
+from collections import deque
+
+# Arquivo (na pasta de logs) com o próximo número de log e os arquivos guardados,
+# para não precisar listar a pasta a cada inicialização
+STATE_FILE = ".log_state.json"
+LOG_NAME_PATTERN = r'log(\d+)\.(txt|jsonl)(\.gz)?'
+# Outros arquivos que o programa salva na pasta de logs (traces da geração) e entram na mesma retenção
+EXTRA_NAME_PATTERN = r'trace_.*\.json'
 
 class Logger:
-    def __init__(self, log_directory="logs"):
+    def __init__(self, log_directory="logs", background=False, capacity=10000, flush_size=200,
+                 flush_interval=5.0, json_lines=False, echo=True, max_bytes=5 * 1024 * 1024,
+                 max_age_days=90, max_files=100, compress=False):
         """
         Inicializa o logger. Define o diretório e o caminho do arquivo de log.
+
+        Rotação: quando o arquivo atual passa de 'max_bytes', o log continua no
+        próximo número. Logs com mais de 'max_age_days' dias são apagados e só os
+        'max_files' mais recentes são mantidos (None desliga cada limite). Com
+        compress=True, os logs antigos são compactados com gzip (logN.txt.gz)
+        por uma thread separada. Arquivos registrados com add_file() (ex.: os
+        traces da geração) seguem os mesmos limites de idade e quantidade.
+
+        Com background=True, as mensagens vão para um buffer circular de no
+        máximo 'capacity' entradas (as mais antigas são descartadas se ele
+        encher) e uma thread grava o buffer no arquivo quando ele chega a
+        'flush_size' entradas ou a cada 'flush_interval' segundos, então log()
+        nunca espera pelo disco. json_lines=True grava uma mensagem JSON por
+        linha (arquivo .jsonl) e echo=False desliga o print no console.
         """
         self.log_directory = log_directory
-        self.log_buffer = []
+        self.background = background
+        self.json_lines = json_lines
+        self.echo = echo
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.max_files = max_files
+        self.compress = compress
+        self.log_buffer = deque(maxlen=capacity) if background else []
+        self.dropped = 0 # Mensagens descartadas porque o buffer circular encheu
+        self._next_log_num = None
+        self._log_files = [] # Logs guardados, do mais antigo para o mais novo (inclui o atual)
+        self._state_lock = threading.RLock() # Protege _log_files e o arquivo de estado
+        self._compress_queue = queue.Queue()
+        self._compressing = set() # Logs na fila de compactação
+        self._compressor = None
         self.log_file_path = self._get_next_log_filepath()
-        
+        self._current_size = 0
+        self._prune_logs()
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._flush_requested = False
+        self._writer = None
+        if background:
+            self._writer = threading.Thread(target=self._writer_loop, name="logger", daemon=True)
+            self._writer.start()
+
         # Log inicial
         self.log("--- Sessão de log iniciada ---")
 
-    def _get_next_log_filepath(self):
+    def _scan_existing_logs(self):
         """
-        Verifica a pasta de logs, encontra o último número de log e retorna
-        o caminho para o próximo arquivo de log (ex: log5.txt).
+        Verifica a pasta de logs e retorna (próximo número, arquivos de log em
+        ordem). Só é usado quando o arquivo de estado não existe (ex.: na
+        primeira execução com rotação).
         """
-        # Garante que a pasta de logs exista
-        os.makedirs(self.log_directory, exist_ok=True)
-        
         # Lista os arquivos de log existentes
-        existing_logs = [f for f in os.listdir(self.log_directory) if f.startswith('log') and f.endswith('.txt')]
-        
+        existing_logs = []
         max_num = 0
-        # Extrai o número de cada nome de arquivo para encontrar o maior
-        for log_file in existing_logs:
+        for log_file in os.listdir(self.log_directory):
             # Usamos expressão regular para extrair o número de forma segura
-            match = re.search(r'log(\d+)\.txt', log_file)
+            match = re.fullmatch(LOG_NAME_PATTERN, log_file)
             if match:
-                num = int(match.group(1))
-                if num > max_num:
-                    max_num = num
-        
+                max_num = max(max_num, int(match.group(1)))
+            elif not re.fullmatch(EXTRA_NAME_PATTERN, log_file):
+                continue
+            try:
+                existing_logs.append((os.path.getmtime(os.path.join(self.log_directory, log_file)), log_file))
+            except OSError:
+                pass
+        existing_logs.sort()
+
         # O próximo log será o maior número encontrado + 1
-        next_log_num = max_num + 1
-        return os.path.join(self.log_directory, f'log{next_log_num}.txt')
+        return max_num + 1, [log_file for _, log_file in existing_logs]
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.log_directory, STATE_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return int(state["next"]), [str(name) for name in state["files"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return self._scan_existing_logs()
+
+    def _save_state(self):
+        # Quem chama já segura _state_lock
+        state_path = os.path.join(self.log_directory, STATE_FILE)
+        temp_path = f"{state_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"next": self._next_log_num, "files": self._log_files}, f)
+            os.replace(temp_path, state_path)
+        except OSError as e:
+            print(f"ERRO: Não foi possível salvar o estado dos logs. Erro: {e}")
+
+    def _get_next_log_filepath(self):
+        """
+        Retorna o caminho para o próximo arquivo de log (ex: log5.txt), usando o
+        número guardado no arquivo de estado.
+        """
+        # Garante que a pasta de logs exista
+        os.makedirs(self.log_directory, exist_ok=True)
+        with self._state_lock:
+            if self._next_log_num is None:
+                self._next_log_num, self._log_files = self._load_state()
+
+            extension = 'jsonl' if self.json_lines else 'txt'
+            log_name = f'log{self._next_log_num}.{extension}'
+            self._next_log_num += 1
+            self._log_files.append(log_name)
+            self._save_state()
+        return os.path.join(self.log_directory, log_name)
+
+    def add_file(self, path):
+        """
+        Coloca um arquivo salvo na pasta de logs (ex.: um trace) sob os mesmos
+        limites de idade e quantidade dos logs.
+        """
+        with self._state_lock:
+            self._log_files.append(os.path.basename(path))
+            self._prune_logs()
 
-    def log(self, message):
+    def _compress_log(self, log_name):
+        """Compacta um log antigo com gzip e troca o nome dele no estado."""
+        path = os.path.join(self.log_directory, log_name)
+        try:
+            with open(path, 'rb') as f_in, gzip.open(f"{path}.gz", 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            # Mantém a data do log original, usada pela idade máxima na poda
+            shutil.copystat(path, f"{path}.gz")
+        except FileNotFoundError:
+            return # Apagado enquanto esperava na fila
+        except OSError as e:
+            print(f"ERRO: Não foi possível compactar o log antigo '{log_name}'. Erro: {e}")
+            return
+        with self._state_lock:
+            if log_name in self._log_files:
+                self._log_files[self._log_files.index(log_name)] = f"{log_name}.gz"
+                self._save_state()
+                removed = path
+            else:
+                removed = f"{path}.gz" # Saiu da retenção enquanto era compactado
+        try:
+            os.remove(removed)
+        except OSError:
+            pass
+
+    def _compress_loop(self):
+        """Thread que compacta os logs antigos, para não travar a interface nem a gravação."""
+        while True:
+            log_name = self._compress_queue.get()
+            if log_name is None:
+                return
+            self._compress_log(log_name)
+            with self._state_lock:
+                self._compressing.discard(log_name)
+
+    def _schedule_compress(self, log_name):
+        with self._state_lock:
+            if log_name in self._compressing:
+                return
+            self._compressing.add(log_name)
+        self._compress_queue.put(log_name)
+        if self._compressor is None:
+            self._compressor = threading.Thread(target=self._compress_loop, name="logger-gzip", daemon=True)
+            self._compressor.start()
+
+    def _prune_logs(self):
+        """
+        Aplica os limites de idade e de quantidade aos logs guardados (sem listar
+        a pasta: só os arquivos do estado) e compacta os antigos, se configurado.
+        """
+        with self._state_lock:
+            current = os.path.basename(self.log_file_path)
+            now = time.time()
+            kept = []
+            to_compress = []
+            for log_name in self._log_files:
+                if log_name == current:
+                    kept.append(log_name)
+                    continue
+                path = os.path.join(self.log_directory, log_name)
+                try:
+                    if self.max_age_days is not None and now - os.path.getmtime(path) > self.max_age_days * 86400:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue # Apagado por fora
+                except OSError as e:
+                    print(f"ERRO: Não foi possível processar o log antigo '{log_name}'. Erro: {e}")
+                kept.append(log_name)
+                if self.compress and re.fullmatch(r'log\d+\.(txt|jsonl)', log_name):
+                    to_compress.append(log_name)
+
+            if self.max_files is not None:
+                while len(kept) > max(self.max_files, 1):
+                    oldest = kept[0] if kept[0] != current else kept[1]
+                    kept.remove(oldest)
+                    try:
+                        os.remove(os.path.join(self.log_directory, oldest))
+                    except OSError:
+                        pass
+            self._log_files = kept
+            self._save_state()
+        for log_name in to_compress:
+            if log_name in kept:
+                self._schedule_compress(log_name)
+
+    def log(self, message, **fields):
         """
         Adiciona uma mensagem de log formatada com timestamp ao buffer em memória.
+        Campos extras (ex.: log("Imagem gerada", arquivo="g1.png", ms=12)) viram
+        chaves do JSON no modo json_lines e 'chave=valor' no texto.
         """
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_entry = f"[{timestamp}] {message}"
-        
+        now = datetime.datetime.now()
+        if self.json_lines:
+            log_entry = json.dumps({"ts": now.isoformat(timespec='milliseconds'), "msg": message, **fields}, ensure_ascii=False, default=str)
+        else:
+            timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+            extras = "".join(f" {key}={value}" for key, value in fields.items())
+            log_entry = f"[{timestamp}] {message}{extras}"
+
         # Imprime no console para feedback em tempo real
-        print(log_entry)
-        
-        # Adiciona à lista (buffer)
-        self.log_buffer.append(log_entry)
+        if self.echo:
+            print(log_entry)
+
+        # Adiciona ao buffer
+        with self._lock:
+            if self.background and len(self.log_buffer) == self.log_buffer.maxlen:
+                self.dropped += 1
+            self.log_buffer.append(log_entry)
+            if self.background and len(self.log_buffer) >= self.flush_size:
+                self._wake.notify()
+
+    def _take_buffer(self):
+        """Retira todas as entradas do buffer (mais o aviso de descartadas, se houver)."""
+        with self._lock:
+            entries = list(self.log_buffer)
+            self.log_buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            message = f"--- {dropped} mensagens de log descartadas (buffer cheio) ---"
+            if self.json_lines:
+                message = json.dumps({"ts": datetime.datetime.now().isoformat(timespec='milliseconds'), "msg": message}, ensure_ascii=False)
+            entries.insert(0, message)
+        return entries
+
+    def _restore_buffer(self, entries):
+        """Devolve ao início do buffer as entradas que não puderam ser gravadas."""
+        with self._lock:
+            if self.background:
+                self.log_buffer.extendleft(reversed(entries))
+            else:
+                self.log_buffer[:0] = entries
+
+    def _write_entries(self, entries):
+        data = '\n'.join(entries) + '\n'
+        with self._write_lock:
+            with open(self.log_file_path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            self._current_size += len(data.encode('utf-8'))
+            # Passou do tamanho máximo: os próximos logs vão para um arquivo novo
+            if self.max_bytes is not None and self._current_size >= self.max_bytes:
+                self.log_file_path = self._get_next_log_filepath()
+                self._current_size = 0
+                self._prune_logs()
+
+    def _writer_loop(self):
+        """Thread do modo background: grava o buffer por tamanho ou por tempo."""
+        while True:
+            with self._lock:
+                if not self._closed and not self._flush_requested and len(self.log_buffer) < self.flush_size:
+                    self._wake.wait(self.flush_interval)
+                closed = self._closed
+                self._flush_requested = False
+            entries = self._take_buffer()
+            if entries:
+                try:
+                    self._write_entries(entries)
+                except Exception as e:
+                    self._restore_buffer(entries)
+                    print(f"ERRO: Não foi possível salvar o log no arquivo. Erro: {e}")
+            if closed:
+                return
 
     def write_buffer_to_file(self):
         """
         Escreve o conteúdo do buffer para o arquivo .txt e limpa o buffer.
         """
-        if not self.log_buffer:
+        entries = self._take_buffer()
+        if not entries:
             return  # Não faz nada se não houver logs para salvar
 
         try:
-            with open(self.log_file_path, 'a', encoding='utf-8') as f:
-                for entry in self.log_buffer:
-                    f.write(entry + '\n')
-            
-            # Limpa o buffer após salvar
-            self.log_buffer = []
-            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Buffer de log salvo em {self.log_file_path}")
+            self._write_entries(entries)
+            if self.echo:
+                print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Buffer de log salvo em {self.log_file_path}")
         except Exception as e:
-            print(f"ERRO: Não foi possível salvar o log no arquivo. Erro: {e}")
\ No newline at end of file
+            self._restore_buffer(entries)
+            print(f"ERRO: Não foi possível salvar o log no arquivo. Erro: {e}")
+
+    def flush(self):
+        """
+        Grava o buffer no arquivo. No modo background, só pede a gravação à thread
+        de gravação (que é a única a escrever no arquivo, mantendo a ordem).
+        """
+        if self._writer is not None:
+            with self._lock:
+                self._flush_requested = True
+                self._wake.notify()
+        else:
+            self.write_buffer_to_file()
+
+    def close(self):
+        """
+        Grava o que ainda estiver no buffer e, no modo background, encerra a
+        thread de gravação.
+        """
+        if self._writer is not None:
+            with self._lock:
+                self._closed = True
+                self._wake.notify()
+            self._writer.join()
+            self._writer = None
+        else:
+            self.write_buffer_to_file()
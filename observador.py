@@ -0,0 +1,179 @@
+import os
+import sys
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+from functions import EXTENSOES_IMAGEM
+
+# inotify (Linux) via ctypes; em outros sistemas, ou se a libc não o tiver, a pasta é verificada por polling
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1
+        _libc.inotify_add_watch
+    except (OSError, AttributeError):
+        _libc = None
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_MASCARA = IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+_CABECALHO_EVENTO = struct.Struct("iIII")
+
+INTERVALO_POLLING = 1.0 # segundos entre as verificações quando não há inotify
+JANELA_AGRUPAMENTO = 0.05 # segundos esperando mais eventos antes de processar um lote do inotify
+
+class ObservadorPasta:
+    """
+    Observa as imagens de uma pasta de preset e chama ao_mudar(pasta, evento, nome)
+    para cada arquivo "adicionada", "modificada" ou "removida".
+
+    Usa inotify quando disponível e, se não, compara o tamanho/mtime dos arquivos
+    a cada INTERVALO_POLLING segundos. Nos dois casos os eventos só são emitidos
+    quando o tamanho ou o mtime do arquivo realmente mudou, então verificar()
+    pode ser chamado a qualquer momento (por exemplo logo depois de o próprio
+    programa alterar a pasta) sem gerar eventos repetidos depois.
+
+    ao_mudar é chamado na thread do observador ou na de quem chamou verificar();
+    quem usa Tk deve repassar os eventos para a thread da interface.
+    """
+    def __init__(self, pasta, ao_mudar, intervalo=INTERVALO_POLLING):
+        self.pasta = pasta
+        self.ao_mudar = ao_mudar
+        self.intervalo = intervalo
+        self._estado = {} # nome -> (tamanho, mtime_ns)
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._fd = None
+        self.modo = None
+
+    def iniciar(self):
+        """Registra o estado atual da pasta (sem emitir eventos) e começa a observá-la."""
+        with self._lock:
+            self._estado = self._listar()
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(fd, os.fsencode(self.pasta), _MASCARA) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        self.modo = "inotify" if self._fd is not None else "polling"
+        alvo = self._loop_inotify if self._fd is not None else self._loop_polling
+        self._thread = threading.Thread(target=alvo, daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """Para a observação. Eventos que ainda estavam sendo processados são descartados."""
+        self._parar.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def verificar(self, nomes=None):
+        """
+        Compara a pasta (ou só os arquivos em 'nomes') com o último estado conhecido
+        e emite um evento para cada diferença.
+        """
+        with self._lock:
+            if nomes is None:
+                atual = self._listar()
+                nomes = set(atual) | set(self._estado)
+            else:
+                atual = {}
+                for nome in nomes:
+                    info = self._stat(nome)
+                    if info is not None:
+                        atual[nome] = info
+            eventos = []
+            for nome in sorted(nomes):
+                antes = self._estado.get(nome)
+                depois = atual.get(nome)
+                if antes == depois:
+                    continue
+                if depois is None:
+                    del self._estado[nome]
+                    eventos.append(("removida", nome))
+                else:
+                    self._estado[nome] = depois
+                    eventos.append(("adicionada" if antes is None else "modificada", nome))
+        for evento, nome in eventos:
+            if self._parar.is_set():
+                return
+            self.ao_mudar(self.pasta, evento, nome)
+
+    def _stat(self, nome):
+        try:
+            info = os.stat(os.path.join(self.pasta, nome))
+        except OSError:
+            return None
+        return info.st_size, info.st_mtime_ns
+
+    def _listar(self):
+        estado = {}
+        try:
+            with os.scandir(self.pasta) as entradas:
+                for arquivo in entradas:
+                    if arquivo.name.lower().endswith(EXTENSOES_IMAGEM) and arquivo.is_file():
+                        info = arquivo.stat()
+                        estado[arquivo.name] = (info.st_size, info.st_mtime_ns)
+        except OSError:
+            pass
+        return estado
+
+    def _loop_polling(self):
+        while not self._parar.wait(self.intervalo):
+            self.verificar()
+
+    def _loop_inotify(self):
+        fd = self._fd
+        while not self._parar.is_set():
+            try:
+                prontos, _, _ = select.select([fd], [], [], 0.5)
+            except (OSError, ValueError):
+                return # fd fechado por parar()
+            if not prontos:
+                continue
+            # Um salvamento gera vários eventos seguidos; junta todos antes de verificar
+            nomes = set()
+            pasta_removida = False
+            while prontos and not self._parar.is_set():
+                try:
+                    dados = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    dados = b""
+                except OSError:
+                    return
+                deslocamento = 0
+                while deslocamento < len(dados):
+                    _, mascara, _, tamanho = _CABECALHO_EVENTO.unpack_from(dados, deslocamento)
+                    deslocamento += _CABECALHO_EVENTO.size
+                    nome = dados[deslocamento:deslocamento + tamanho].rstrip(b"\0")
+                    deslocamento += tamanho
+                    if mascara & (IN_DELETE_SELF | IN_IGNORED):
+                        pasta_removida = True
+                    elif nome:
+                        nome = os.fsdecode(nome)
+                        if nome.lower().endswith(EXTENSOES_IMAGEM):
+                            nomes.add(nome)
+                try:
+                    prontos, _, _ = select.select([fd], [], [], JANELA_AGRUPAMENTO)
+                except (OSError, ValueError):
+                    return
+            if pasta_removida:
+                self.verificar() # Todos os arquivos conhecidos viram "removida"
+                return
+            if nomes:
+                self.verificar(nomes)
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from functions import PASTA_LOJA, limpar_loja, vincular_da_loja
+
+class TestLimparLoja(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+
+    def _blobs(self):
+        pasta_loja = os.path.join(self.base_dir, PASTA_LOJA)
+        return [os.path.join(raiz, nome) for raiz, _, nomes in os.walk(pasta_loja) for nome in nomes]
+
+    def test_imagem_usada_por_outro_preset_continua_na_loja(self):
+        origem = os.path.join(self.base_dir, "raw.png")
+        Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(origem)
+        for preset in ("AAAAAA", "BBBBBB"):
+            os.makedirs(os.path.join(self.base_dir, preset))
+            vincular_da_loja(origem, os.path.join(self.base_dir, preset, "g1.png"), self.base_dir)
+        self.assertEqual(len(self._blobs()), 1)
+
+        shutil.rmtree(os.path.join(self.base_dir, "AAAAAA"))
+        self.assertEqual(limpar_loja(self.base_dir)[0], 0)
+        self.assertEqual(len(self._blobs()), 1)
+
+        shutil.rmtree(os.path.join(self.base_dir, "BBBBBB"))
+        self.assertEqual(limpar_loja(self.base_dir)[0], 1)
+        self.assertEqual(self._blobs(), [])
+
+if __name__ == "__main__":
+    unittest.main()
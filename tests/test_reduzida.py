@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from functions import carregar_reduzida, carregar_miniatura, carregar_g1_colorido, miniatura_fundo
+
+def _imagem_16_bits(tamanho):
+    largura, altura = tamanho
+    dados = bytearray()
+    for y in range(altura):
+        for x in range(largura):
+            dados += ((x * 60) & 0xFFFF).to_bytes(2, "little")
+    return Image.frombytes("I;16", tamanho, bytes(dados))
+
+class TestModosSemReduce(unittest.TestCase):
+    """Imagens em modos que Image.reduce() não aceita ("1" e "I;16")."""
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.imagens = {
+            "I;16": _imagem_16_bits((1000, 600)),
+            "1": Image.new("1", (1000, 600), 1),
+        }
+
+    def _salvar(self, modo, pasta=""):
+        caminho = os.path.join(self.base_dir, pasta, "g1.png")
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.imagens[modo].save(caminho)
+        with Image.open(caminho) as img:
+            self.assertEqual(img.mode, modo)
+        return caminho
+
+    def test_carregar_reduzida(self):
+        for modo in self.imagens:
+            with self.subTest(modo=modo):
+                img = carregar_reduzida(self._salvar(modo), (146, 96))
+                self.assertEqual(img.resize((146, 96)).size, (146, 96))
+
+    def test_miniaturas_e_preview_da_g1(self):
+        for modo in self.imagens:
+            with self.subTest(modo=modo):
+                codigo = f"preset_{modo.replace(';', '_')}"
+                caminho = self._salvar(modo, codigo)
+                preset_info = {"code": codigo, "color": "#3366CC", "opacidade": 30, "no_color": False}
+                self.assertEqual(carregar_miniatura(caminho, (146, 96), self.base_dir).size, (146, 96))
+                self.assertEqual(miniatura_fundo(preset_info, self.base_dir).size, (146, 96))
+                self.assertIsNotNone(carregar_g1_colorido(codigo, "#3366CC", 30, False, self.base_dir))
+
+if __name__ == "__main__":
+    unittest.main()